@@ -0,0 +1,409 @@
+import json
+import os
+import re
+import sqlite3
+import uuid
+import threading
+from datetime import date, datetime
+
+# Supabase のテーブル API とストレージ API のうち、players.py が使う範囲だけを SQLite とローカルディレクトリで再現する。
+# オフラインでの性能計測・負荷試験用、および 1 台で運用する小規模クラブ向け。
+
+SCHEMA = {
+    "players": {
+        "id": "INTEGER PRIMARY KEY AUTOINCREMENT", "name": "TEXT", "number": "INTEGER", "position": "TEXT",
+        "height": "REAL", "weight": "REAL", "password_hash": "TEXT", "parent_password_hash": "TEXT", "image_url": "TEXT",
+    },
+    "conditions": {
+        "id": "INTEGER PRIMARY KEY AUTOINCREMENT", "player_name": "TEXT", "date": "TEXT", "weight": "REAL",
+        "fatigue": "INTEGER", "sleep": "INTEGER", "injury": "TEXT", "injury_detail": "TEXT",
+    },
+    "physical_tests": {
+        "id": "INTEGER PRIMARY KEY AUTOINCREMENT", "player_name": "TEXT", "test_name": "TEXT", "value": "REAL", "date": "TEXT",
+    },
+    "tactics_board": {
+        "id": "INTEGER PRIMARY KEY AUTOINCREMENT", "title": "TEXT", "category": "TEXT", "description": "TEXT",
+        "media_url": "TEXT", "media_type": "TEXT",
+    },
+    "injury_reports": {
+        "id": "INTEGER PRIMARY KEY AUTOINCREMENT", "player_name": "TEXT", "injury_name": "TEXT", "injured_date": "TEXT",
+        "target_return_date": "TEXT", "current_phase": "TEXT", "is_active": "BOOLEAN",
+    },
+    "rehab_plans": {
+        "id": "INTEGER PRIMARY KEY AUTOINCREMENT", "injury_id": "INTEGER", "target_week_start": "TEXT",
+        "menu_description": "TEXT", "trainer_comment": "TEXT", "is_approved": "BOOLEAN",
+    },
+}
+
+INDEXES = [
+    ("players_name", "players", "name"),
+    ("conditions_player_date", "conditions", "player_name, date"),
+    ("conditions_date", "conditions", "date"),
+    ("physical_tests_player_test", "physical_tests", "player_name, test_name, date"),
+    ("physical_tests_test", "physical_tests", "test_name"),
+    ("tactics_board_category", "tactics_board", "category"),
+    ("tactics_board_category_id", "tactics_board", "category, id"),
+    ("injury_reports_player_active", "injury_reports", "player_name, is_active"),
+    ("rehab_plans_injury", "rehab_plans", "injury_id, is_approved"),
+]
+
+# 埋め込み select（PostgREST の "*,injury_reports!inner(...)"）で辿れる外部キー。{(テーブル, 参照先): (外部キー列, 参照先の列)}
+FOREIGN_KEYS = {
+    ("rehab_plans", "injury_reports"): ("injury_id", "id"),
+}
+
+# スキーマ変更は migrations/ の SQL（Supabase と共通）を番号順に当てる。適用済みの番号は PRAGMA user_version に残す
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+
+class LocalResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class LocalQuery:
+    """supabase.table(...) と同じ書き方で組み立て、execute() で SQLite に発行する"""
+
+    def __init__(self, client, table_name):
+        if table_name not in SCHEMA:
+            raise ValueError(f"未知のテーブルです: {table_name}")
+        self.client = client
+        self.table_name = table_name
+        self.schema = SCHEMA[table_name]
+        self.mode = "select"
+        self.columns = list(self.schema)
+        self.embeds = []
+        self.payload = None
+        self.want_count = False
+        self.where = []
+        self.params = []
+        self.order_by = []
+        self.limit_n = None
+        self.offset_n = 0
+
+    def _col(self, name):
+        name = name.strip()
+        if name not in self.schema:
+            raise ValueError(f"{self.table_name} に列 {name} はありません")
+        return name
+
+    def _ref(self, name):
+        # フィルタ・並び替え用の列参照。"injury_reports.is_active" のように埋め込み先の列も指定できる
+        name = name.strip()
+        if "." in name:
+            table, col = name.split(".", 1)
+            if table not in [e for e, _, _ in self.embeds] or col not in SCHEMA[table]:
+                raise ValueError(f"{self.table_name} から {name} は参照できません（select で埋め込んでください）")
+            return f"{table}.{col}", SCHEMA[table][col]
+        return f"{self.table_name}.{self._col(name)}", self.schema[name]
+
+    def _value(self, typ, val):
+        # pandas の行から取り出した numpy のスカラーは Python の値に直す（そのままだと SQLite に BLOB として渡ってしまう）
+        if hasattr(val, "item") and not isinstance(val, (str, bytes)): val = val.item()
+        if isinstance(val, bool): return int(val)
+        if isinstance(val, (date, datetime)): return val.isoformat()
+        if typ == "BOOLEAN" and isinstance(val, str): return int(val.lower() == "true")
+        return val
+
+    # --- 操作 ---
+    def select(self, *columns, count=None, head=None):
+        cols = ",".join(columns) if columns else "*"
+        # 括弧の外のカンマだけで区切る（埋め込み先の列リストを分割しないように）
+        tokens = [t.strip() for t in re.split(r",(?![^()]*\))", cols) if t.strip()]
+        self.columns, self.embeds = [], []
+        for t in tokens:
+            m = re.fullmatch(r"(\w+)(!inner)?\((.*)\)", t)
+            if m:
+                table, inner, sub = m.group(1), bool(m.group(2)), m.group(3).strip()
+                if (self.table_name, table) not in FOREIGN_KEYS: raise ValueError(f"{self.table_name} から {table} は埋め込めません")
+                sub_cols = list(SCHEMA[table]) if sub in ("", "*") else [c.strip() for c in sub.split(",")]
+                for c in sub_cols:
+                    if c not in SCHEMA[table]: raise ValueError(f"{table} に列 {c} はありません")
+                self.embeds.append((table, sub_cols, inner))
+            elif t == "*": self.columns += list(self.schema)
+            else: self.columns.append(self._col(t))
+        self.want_count = count is not None
+        return self
+
+    def insert(self, json, count=None, returning=None, upsert=False, default_to_null=True):
+        self.mode, self.payload = "insert", json if isinstance(json, list) else [json]
+        return self
+
+    def upsert(self, json, count=None, returning=None, ignore_duplicates=False, on_conflict="", default_to_null=True):
+        self.mode, self.payload = "upsert", json if isinstance(json, list) else [json]
+        self.conflict = [self._col(c) for c in on_conflict.split(",")] if on_conflict else ["id"]
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, json, count=None, returning=None):
+        self.mode, self.payload = "update", json
+        return self
+
+    def delete(self, count=None, returning=None):
+        self.mode = "delete"
+        return self
+
+    # --- フィルタ ---
+    def _filter(self, col, op, val):
+        ref, typ = self._ref(col)
+        self.where.append(f"{ref} {op} ?")
+        self.params.append(self._value(typ, val))
+        return self
+
+    def eq(self, col, val): return self._filter(col, "=", val)
+    def neq(self, col, val): return self._filter(col, "!=", val)
+    def gt(self, col, val): return self._filter(col, ">", val)
+    def gte(self, col, val): return self._filter(col, ">=", val)
+    def lt(self, col, val): return self._filter(col, "<", val)
+    def lte(self, col, val): return self._filter(col, "<=", val)
+
+    def in_(self, col, values):
+        ref, typ = self._ref(col)
+        values = list(values)
+        if not values:
+            self.where.append("0")
+            return self
+        self.where.append(f"{ref} IN ({','.join('?' * len(values))})")
+        self.params.extend(self._value(typ, v) for v in values)
+        return self
+
+    def is_(self, col, val):
+        ref, typ = self._ref(col)
+        self.where.append(f"{ref} IS NULL" if val in (None, "null") else f"{ref} = ?")
+        if val not in (None, "null"): self.params.append(self._value(typ, val))
+        return self
+
+    def order(self, col, desc=False, nullsfirst=None):
+        self.order_by.append(f"{self._ref(col)[0]} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def range(self, start, end):
+        self.offset_n, self.limit_n = start, end - start + 1
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    # --- 実行 ---
+    def _where_sql(self):
+        return f" WHERE {' AND '.join(self.where)}" if self.where else ""
+
+    def _rows(self, cursor, columns):
+        bools = [c for c in columns if self.schema.get(c) == "BOOLEAN"]
+        rows = [dict(zip(columns, r)) for r in cursor.fetchall()]
+        for row in rows:
+            for c in bools:
+                if row[c] is not None: row[c] = bool(row[c])
+        return rows
+
+    def _from_sql(self):
+        sql = self.table_name
+        for table, _, inner in self.embeds:
+            fk, pk = FOREIGN_KEYS[(self.table_name, table)]
+            sql += f" {'JOIN' if inner else 'LEFT JOIN'} {table} ON {self.table_name}.{fk} = {table}.{pk}"
+        return sql
+
+    def _select(self, conn):
+        # 埋め込み先の列は PostgREST と同じく {"injury_reports": {...}} の入れ子で返す
+        refs = [f"{self.table_name}.{c}" for c in self.columns] + [f"{t}.{c}" for t, cols, _ in self.embeds for c in cols]
+        sql = f"SELECT {', '.join(refs)} FROM {self._from_sql()}{self._where_sql()}"
+        if self.order_by: sql += f" ORDER BY {', '.join(self.order_by)}"
+        if self.limit_n is not None or self.offset_n: sql += f" LIMIT {int(self.limit_n if self.limit_n is not None else -1)} OFFSET {int(self.offset_n)}"
+        rows = []
+        for r in conn.execute(sql, self.params).fetchall():
+            vals = iter(r)
+            row = {c: next(vals) for c in self.columns}
+            for t, cols, _ in self.embeds:
+                sub = {c: next(vals) for c in cols}
+                row[t] = sub if any(v is not None for v in sub.values()) else None
+            for t, schema in [(None, self.schema)] + [(t, SCHEMA[t]) for t, _, _ in self.embeds]:
+                target = row if t is None else row[t]
+                for c in (target or {}):
+                    if schema.get(c) == "BOOLEAN" and target[c] is not None: target[c] = bool(target[c])
+            rows.append(row)
+        return rows
+
+    def execute(self):
+        res = self._execute()
+        # 書き込みは Supabase Realtime と同じ形の変更イベントとして購読者へ流す（ロックを外してから）
+        if self.mode != "select" and res.data:
+            event = {"insert": "INSERT", "upsert": "UPDATE", "update": "UPDATE", "delete": "DELETE"}[self.mode]
+            self.client.publish(self.table_name, event, res.data)
+        return res
+
+    def _execute(self):
+        with self.client.lock:
+            conn = self.client.conn
+            if self.mode == "select":
+                count = conn.execute(f"SELECT COUNT(*) FROM {self._from_sql()}{self._where_sql()}", self.params).fetchone()[0] if self.want_count else None
+                return LocalResponse(self._select(conn), count)
+
+            returning = list(self.schema)
+            if self.mode == "insert":
+                data = []
+                with conn:
+                    for row in self.payload:
+                        cols = [self._col(c) for c in row]
+                        sql = f"INSERT INTO {self.table_name} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) RETURNING {', '.join(returning)}"
+                        data += self._rows(conn.execute(sql, [self._value(self.schema[c], row[c]) for c in cols]), returning)
+                return LocalResponse(data)
+            if self.mode == "upsert":
+                data = []
+                with conn:
+                    for row in self.payload:
+                        cols = [self._col(c) for c in row]
+                        sets = [f"{c} = excluded.{c}" for c in cols if c not in self.conflict]
+                        action = "DO NOTHING" if self.ignore_duplicates or not sets else f"DO UPDATE SET {', '.join(sets)}"
+                        sql = (f"INSERT INTO {self.table_name} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+                               f"ON CONFLICT ({', '.join(self.conflict)}) {action} RETURNING {', '.join(returning)}")
+                        data += self._rows(conn.execute(sql, [self._value(self.schema[c], row[c]) for c in cols]), returning)
+                return LocalResponse(data)
+            if self.mode == "update":
+                cols = [self._col(c) for c in self.payload]
+                sql = f"UPDATE {self.table_name} SET {', '.join(f'{c} = ?' for c in cols)}{self._where_sql()} RETURNING {', '.join(returning)}"
+                with conn:
+                    return LocalResponse(self._rows(conn.execute(sql, [self._value(self.schema[c], self.payload[c]) for c in cols] + self.params), returning))
+            if self.mode == "delete":
+                with conn:
+                    return LocalResponse(self._rows(conn.execute(f"DELETE FROM {self.table_name}{self._where_sql()} RETURNING {', '.join(returning)}", self.params), returning))
+        raise ValueError(f"未対応の操作です: {self.mode}")
+
+
+class LocalBucket:
+    def __init__(self, root, bucket):
+        self.dir = os.path.join(root, bucket)
+        self.upload_dir = os.path.join(root, ".uploads", bucket)
+        os.makedirs(self.dir, exist_ok=True)
+
+    def _path(self, path):
+        full = os.path.abspath(os.path.join(self.dir, path))
+        if not full.startswith(os.path.abspath(self.dir) + os.sep):
+            raise ValueError(f"不正なパスです: {path}")
+        return full
+
+    def upload(self, path, file, file_options=None):
+        full = self._path(path)
+        if os.path.exists(full) and str((file_options or {}).get("upsert", "false")).lower() != "true":
+            raise FileExistsError(f"既に存在します: {path}")
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "wb") as f:
+            f.write(file if isinstance(file, (bytes, bytearray)) else file.read())
+        return {"path": path}
+
+    def get_public_url(self, path):
+        # ローカル運用では公開 URL の代わりにファイルパスを返す（show_player_image はパスも表示できる）
+        return self._path(path)
+
+    def list(self, path="", options=None):
+        search = (options or {}).get("search", "")
+        folder = self._path(path) if path else self.dir
+        if not os.path.isdir(folder): return []
+        return [{"name": n} for n in sorted(os.listdir(folder)) if search in n]
+
+    # --- 再開可能アップロード（Supabase の TUS エンドポイントと同じ手順: 作成 → オフセット確認 → 続きのチャンク送信）---
+    def _upload_files(self, upload_id):
+        if not upload_id.isalnum(): raise ValueError(f"不正なアップロード ID です: {upload_id}")
+        base = os.path.join(self.upload_dir, upload_id)
+        return base + ".json", base + ".part"
+
+    def create_upload(self, path, length, file_options=None):
+        full = self._path(path)
+        if os.path.exists(full) and str((file_options or {}).get("upsert", "false")).lower() != "true":
+            raise FileExistsError(f"既に存在します: {path}")
+        upload_id = uuid.uuid4().hex
+        meta, part = self._upload_files(upload_id)
+        os.makedirs(self.upload_dir, exist_ok=True)
+        with open(meta, "w") as f: json.dump({"path": path, "length": int(length)}, f)
+        open(part, "wb").close()
+        if not length: self._finish(upload_id)
+        return upload_id
+
+    def upload_offset(self, upload_id):
+        meta, part = self._upload_files(upload_id)
+        if not os.path.exists(meta): raise FileNotFoundError(f"アップロードが見つかりません: {upload_id}")
+        with open(meta) as f: info = json.load(f)
+        # 完了済みのアップロードは宣言したサイズを返す（最後の応答を取りこぼした場合の確認用）
+        return info["length"] if info.get("done") else os.path.getsize(part)
+
+    def upload_chunk(self, upload_id, offset, data):
+        current = self.upload_offset(upload_id)
+        if offset != current: raise ValueError(f"オフセットが一致しません (送信 {offset} / 受信済み {current})")
+        meta, part = self._upload_files(upload_id)
+        with open(meta) as f: length = json.load(f)["length"]
+        if offset + len(data) > length: raise ValueError("宣言したサイズを超えています")
+        with open(part, "ab") as f: f.write(data)
+        if offset + len(data) == length: self._finish(upload_id)
+        return offset + len(data)
+
+    def _finish(self, upload_id):
+        meta, part = self._upload_files(upload_id)
+        with open(meta) as f: info = json.load(f)
+        full = self._path(info["path"])
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        os.replace(part, full)
+        with open(meta, "w") as f: json.dump(dict(info, done=True), f)
+
+    def remove(self, paths):
+        for p in paths:
+            if os.path.exists(self._path(p)): os.remove(self._path(p))
+        return [{"name": p} for p in paths]
+
+
+class LocalStorage:
+    def __init__(self, root):
+        self.root = root
+
+    def from_(self, bucket):
+        return LocalBucket(self.root, bucket)
+
+
+class LocalClient:
+    """create_client() の代わりに使うローカルクライアント（SQLite + ローカルディレクトリ）"""
+
+    def __init__(self, db_path="team_ops.db", storage_dir="team_ops_storage"):
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.storage = LocalStorage(storage_dir)
+        self.subscribers = []
+        self._ensure_schema()
+
+    def subscribe(self, callback):
+        # 変更フィードの代わり。callback には Realtime の postgres_changes と同じ形の payload を渡す
+        with self.lock:
+            self.subscribers.append(callback)
+        return lambda: self.subscribers.remove(callback)
+
+    def publish(self, table_name, event, rows):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        now = datetime.now().isoformat()
+        for row in rows:
+            data = {"schema": "public", "table": table_name, "type": event, "commit_timestamp": now, "errors": None, "columns": []}
+            if event == "DELETE": data["old_record"] = row
+            else: data["record"] = row
+            for callback in subscribers:
+                try: callback({"data": data, "ids": []})
+                except Exception: pass
+
+    def _ensure_schema(self):
+        with self.lock, self.conn:
+            for table, cols in SCHEMA.items():
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(f'{c} {t}' for c, t in cols.items())})")
+            for name, table, cols in INDEXES:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name} ON {table} ({cols})")
+        self._migrate()
+
+    def _migrate(self):
+        with self.lock:
+            done = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            for name in sorted(os.listdir(MIGRATIONS_DIR)):
+                if not name.endswith(".sql") or int(name.split("_")[0]) <= done: continue
+                with open(os.path.join(MIGRATIONS_DIR, name), encoding="utf-8") as f:
+                    self.conn.executescript(f.read())
+                self.conn.execute(f"PRAGMA user_version = {int(name.split('_')[0])}")
+
+    def table(self, table_name):
+        return LocalQuery(self, table_name)
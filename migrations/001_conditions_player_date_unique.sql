@@ -0,0 +1,11 @@
+-- コンディションは 1 人 1 日 1 件（players.py は (player_name, date) で upsert する）。
+-- 既存の重複を最新の 1 件（id 最大）に整理してから、upsert の on_conflict が使うユニークインデックスを作る。
+-- 何度流しても結果は同じ。Supabase では SQL Editor か `supabase db push` で適用し、ローカル版 (local_backend.py) は起動時に自動で適用する。
+BEGIN;
+
+DELETE FROM conditions
+WHERE id NOT IN (SELECT MAX(id) FROM conditions GROUP BY player_name, date);
+
+CREATE UNIQUE INDEX IF NOT EXISTS conditions_player_name_date_key ON conditions (player_name, date);
+
+COMMIT;
@@ -11,6 +11,8 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.cidfonts import UnicodeCIDFont
 from reportlab.lib.units import mm
 
+from withholding_tax import calculate_withholding_tax_array, read_tax_table
+
 # 設定
 st.set_page_config(page_title="給与計算システム", layout="wide")
 DATA_DIR = 'data'
@@ -83,20 +85,12 @@ def generate_zengin_data(df, payment_date_str, company_name_kana, company_code):
     return text_data.encode('cp932')
 
 # --- 計算ロジック ---
-def calculate_withholding_tax(taxable_income, dependents):
-    """源泉徴収税額表（簡易版）"""
-    if taxable_income < 88000: return 0
-    adjusted_income = taxable_income - (dependents * 25000)
-    if adjusted_income < 88000: return 0
-    
-    tax = 0
-    if adjusted_income < 150000:
-        tax = adjusted_income * 0.02
-    elif adjusted_income < 300000:
-        tax = (adjusted_income * 0.05) - 2000 
-    else:
-        tax = (adjusted_income * 0.10) - 10000 
-    return max(0, int(tax))
+# 税額は withholding_tax.py で計算する。国税庁の月額表を使う場合はここに CSV を置く（列の形式は read_tax_table を参照）
+TAX_TABLE_FILE = os.path.join(DATA_DIR, 'withholding_tax_table.csv')
+
+@st.cache_data
+def load_tax_table(path=TAX_TABLE_FILE):
+    return read_tax_table(path)
 
 def load_data():
     try:
@@ -126,7 +120,7 @@ def calculate_salary(df):
     if 'dependents' not in df.columns: df['dependents'] = 0
     else: df['dependents'] = df['dependents'].fillna(0)
 
-    df['income_tax'] = df.apply(lambda row: calculate_withholding_tax(row['taxable_income'], row['dependents']), axis=1)
+    df['income_tax'] = calculate_withholding_tax_array(df['taxable_income'], df['dependents'], load_tax_table())
     df['deduction_total'] = df['social_insurance'] + df['income_tax']
     df['net_payment'] = df['total_payment'] - df['deduction_total']
     
@@ -201,10 +195,16 @@ if menu == "ダッシュボード":
         st.caption("※ファイルが選択されていないため、dataフォルダ内のテスト用データを使用します。")
         att_df = default_att_df
 
+    st.caption("※所得税は " + ("月額表 (" + TAX_TABLE_FILE + ")" if os.path.exists(TAX_TABLE_FILE) else "簡易版の税額区分") + " で計算します。")
+
     if st.button("計算実行"):
         # データ結合と計算
         merged_df = pd.merge(att_df, emp_df, on='employee_id', how='left')
-        result_df = calculate_salary(merged_df)
+        try:
+            result_df = calculate_salary(merged_df)
+        except ValueError as e:
+            st.error(f"税額計算エラー: {e}")
+            st.stop()
         st.session_state['result_df'] = result_df
         
         st.success("計算が完了しました！")
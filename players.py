@@ -1,20 +1,86 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
+import io
 import time
+import threading
+import queue
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from datetime import date, datetime, timedelta
 import plotly.express as px
+from PIL import Image, ImageOps
 import hashlib
-from supabase import create_client, Client
+import re
+import base64
+from collections import deque, OrderedDict
+from types import SimpleNamespace
+from urllib.parse import urljoin
+import httpx
+import asyncio
+from realtime import AsyncRealtimeClient, RealtimeSubscribeStates
+from supabase import create_client, Client, ClientOptions
+from local_backend import LocalClient
+from portfolio_pdf import build_portfolio_zip
+from squad_metrics import PHYS_TESTS, ALERT_THRESHOLDS, detect_condition_alerts, calculate_streaks, calculate_streak, calculate_physical_score_matrix
+from table_cache import TABLE_CACHE_TTL, TableCache, fetch_rows
+from season_archive import ARCHIVE_SCHEMAS, SEASON_START_MONTH, archive_columns, archive_version, archive_summary, read_archive, write_archive, season_of, season_start
 
 # --- 1. ページ設定 ---
 st.set_page_config(page_title="Team Ops Hub", page_icon="⚽", layout="wide", initial_sidebar_state="collapsed")
 
 # --- 2. Supabase接続設定 ---
+# クライアントと HTTP 接続プールはプロセス全体で 1 つだけ作り、全セッション・全再描画で使い回す（keep-alive で TLS 接続を再利用する）
+SUPABASE_MAX_CONNECTIONS = 32
+SUPABASE_KEEPALIVE_SECONDS = 60
+
+class ConnectionStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def on_request(self, request):
+        with self.lock: self.requests += 1
+        request.extensions["trace"] = self.trace
+
+    def trace(self, event_name, info):
+        # 新しい TCP 接続を張った時だけ呼ばれるイベント。リクエスト数との差が再利用された回数
+        if event_name == "connection.connect_tcp.complete":
+            with self.lock: self.connections += 1
+
+    def summary(self):
+        with self.lock:
+            reuse = 1 - self.connections / self.requests if self.requests else 0.0
+            return f"HTTP リクエスト {self.requests} 件 / 新規接続 {self.connections} 件 (接続再利用率 {reuse:.0%})"
+
+@st.cache_resource
+def _connection_stats():
+    return ConnectionStats()
+
+# TEAM_OPS_BACKEND=sqlite の場合は Supabase の代わりにローカルの SQLite + ディレクトリを使う（オフラインでの計測・小規模運用向け）
+LOCAL_BACKEND = os.environ.get("TEAM_OPS_BACKEND") == "sqlite"
+LOCAL_DB_PATH = os.environ.get("TEAM_OPS_DB", "team_ops.db")
+LOCAL_STORAGE_DIR = os.environ.get("TEAM_OPS_STORAGE", "team_ops_storage")
+
+@st.cache_resource
+def _http_client():
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=SUPABASE_MAX_CONNECTIONS, max_keepalive_connections=SUPABASE_MAX_CONNECTIONS, keepalive_expiry=SUPABASE_KEEPALIVE_SECONDS),
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        event_hooks={"request": [_connection_stats().on_request]},
+    )
+
+@st.cache_resource
+def get_supabase():
+    if LOCAL_BACKEND: return LocalClient(LOCAL_DB_PATH, LOCAL_STORAGE_DIR)
+    return create_client(st.secrets["supabase"]["url"], st.secrets["supabase"]["key"], options=ClientOptions(httpx_client=_http_client()))
+
 try:
-    SUPABASE_URL = st.secrets["supabase"]["url"]
-    SUPABASE_KEY = st.secrets["supabase"]["key"]
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    SUPABASE_URL = None if LOCAL_BACKEND else st.secrets["supabase"]["url"]
+    SUPABASE_KEY = None if LOCAL_BACKEND else st.secrets["supabase"]["key"]
+    supabase: Client = get_supabase()
 except Exception as e:
     st.error(f"データベース接続エラー: secrets.toml の設定を確認してください。\n{e}")
     st.stop()
@@ -23,96 +89,1030 @@ except Exception as e:
 def hash_password(password):
     return hashlib.sha256(str(password).encode()).hexdigest()
 
-def fetch_table_as_df(table_name):
+@st.cache_resource
+def _table_cache():
+    return TableCache()
+
+def fetch_table_as_df(table_name, columns="*", filters=()):
     try:
-        response = supabase.table(table_name).select("*").order("id").execute()
-        df = pd.DataFrame(response.data)
-        if not df.empty and "date" in df.columns:
-            df["date"] = pd.to_datetime(df["date"]).dt.date
-        return df
+        return _table_cache().fetch(supabase, table_name, columns, filters)
     except Exception as e:
         return pd.DataFrame()
 
+def invalidate_table(table_name, full=False):
+    # insert 後は差分同期で追いつけるので TTL だけ切る。update / delete は既存行が変わるので破棄して再取得
+    _table_cache().invalidate(table_name, full=full)
+    # サーバー側で結合したリハビリ計画は故障情報の変更も含むので一緒に取り直す
+    if table_name == "injury_reports" and REHAB_SERVER_JOIN: _table_cache().invalidate("rehab_plans", full=True)
+
+def data_version(table_name):
+    return _table_cache().version(table_name)
+
+# 書き込みキュー。insert / upsert は画面を待たせずに積んでおき、ワーカーが WRITE_BATCH_WAIT 秒の間に届いた分をテーブルごとに一括で書く。
+# upsert は同じキーの行をバッチ内で最後の 1 件にまとめてから送る（同じ行を 2 回更新する upsert は Postgres がエラーにするため）。
+# 一時的な失敗は指数バックオフで再試行し、それでも失敗した行は送信したセッションに表示する
+WRITE_BATCH_WAIT = 0.2
+WRITE_MAX_RETRIES = 3
+WRITE_CONFIRM_TIMEOUT = 1.0
+
+def _is_transient(e):
+    if isinstance(e, (httpx.TransportError, TimeoutError, ConnectionError)): return True
+    if isinstance(e, sqlite3.OperationalError): return "locked" in str(e)
+    code = str(getattr(e, "code", "") or "")
+    return code.startswith("5") or code in ("PGRST000", "PGRST001", "PGRST002")
+
+def _missing_unique_key(e):
+    # on_conflict に対応するユニーク制約が無い（migrations/ が未適用）。Postgres は 42P10、SQLite はメッセージで判定する
+    return str(getattr(e, "code", "") or "") == "42P10" or "ON CONFLICT clause does not match" in str(e)
+
+def _upsert_by_key(client, table_name, rows, on_conflict):
+    # ユニーク制約が無い間の代わり。キーが同じ既存行（id 最大）を更新し、無ければ insert する
+    data = []
+    for row in rows:
+        query = client.table(table_name).select("id")
+        for k in on_conflict.split(","): query = query.eq(k, row[k])
+        hit = query.order("id", desc=True).limit(1).execute().data
+        if hit: data += client.table(table_name).update(row).eq("id", hit[0]["id"]).execute().data
+        else: data += client.table(table_name).insert(row).execute().data
+    return SimpleNamespace(data=data)
+
+def _write_rows(client, table_name, rows, on_conflict=None):
+    # 一時的な失敗だけ指数バックオフで再試行し、最後の例外はそのまま投げる
+    for attempt in range(WRITE_MAX_RETRIES + 1):
+        try:
+            if not on_conflict: return client.table(table_name).insert(rows).execute()
+            try:
+                return client.table(table_name).upsert(rows, on_conflict=on_conflict).execute()
+            except Exception as e:
+                if not _missing_unique_key(e): raise
+            return _upsert_by_key(client, table_name, rows, on_conflict)
+        except Exception as e:
+            if not _is_transient(e) or attempt == WRITE_MAX_RETRIES: raise
+            time.sleep(0.5 * 2 ** attempt)
+
+class WriteQueue:
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+        self.queue = queue.Queue()
+        self.cond = threading.Condition()
+        self.pending = {}
+        self.failures = {}
+        self.written = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def enqueue(self, table_name, row, owner=None, on_conflict=None):
+        with self.cond:
+            self.pending[owner] = self.pending.get(owner, 0) + 1
+        self.queue.put((table_name, on_conflict, row, owner))
+
+    def wait(self, owner, timeout=WRITE_CONFIRM_TIMEOUT):
+        # 送信したセッションだけ、自分の書き込みが反映されるまで最大 timeout 秒待つ（読み直した画面に今の送信が載るように）
+        with self.cond:
+            return self.cond.wait_for(lambda: self.pending.get(owner, 0) == 0, timeout=timeout)
+
+    def pop_failures(self, owner):
+        with self.cond:
+            return self.failures.pop(owner, [])
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.time() + WRITE_BATCH_WAIT
+            while time.time() < deadline:
+                try: batch.append(self.queue.get(timeout=max(0, deadline - time.time())))
+                except queue.Empty: break
+            by_table = {}
+            for table_name, on_conflict, row, owner in batch: by_table.setdefault((table_name, on_conflict), []).append((row, owner))
+            for (table_name, on_conflict), items in by_table.items():
+                try:
+                    self._write(table_name, items, on_conflict)
+                except Exception as e:
+                    with self.cond:
+                        for row, owner in items: self.failures.setdefault(owner, []).append((table_name, row, str(e)))
+                finally:
+                    # 送信待ちの数はジョブ 1 件につきここで 1 回だけ減らす
+                    with self.cond:
+                        for row, owner in items: self.pending[owner] -= 1
+                        self.cond.notify_all()
+
+    def _write(self, table_name, items, on_conflict=None):
+        # 書き込んで成功数・失敗を記録する（pending は _run が減らす）
+        rows = [row for row, _ in items]
+        if on_conflict:
+            keys = on_conflict.split(",")
+            rows = list({tuple(row.get(k) for k in keys): row for row in rows}.values())
+        try:
+            res = _write_rows(self.client, table_name, rows, on_conflict)
+        except Exception as e:
+            if len(items) > 1:
+                # まとめた中の 1 行が原因の場合に他の行を巻き込まないよう、1 行ずつ書き直す
+                for item in items: self._write(table_name, [item], on_conflict)
+                return
+            with self.cond:
+                for row, owner in items: self.failures.setdefault(owner, []).append((table_name, row, str(e)))
+            return
+        with self.cond: self.written += len(items)
+        # 書き込みは済んでいるので、キャッシュへの反映に失敗しても書き直しや失敗扱いにはせず、破棄して取り直させる
+        try:
+            if on_conflict: self.cache.patch(table_name, res.data)
+            else: self.cache.invalidate(table_name)
+        except Exception:
+            self.cache.invalidate(table_name, full=True)
+
+@st.cache_resource
+def _write_queue():
+    return WriteQueue(supabase, _table_cache())
+
+def enqueue_insert(table_name, row):
+    _write_queue().enqueue(table_name, row, owner=st.session_state.get("user_name"))
+
+# コンディションは 1 人 1 日 1 件。同じ日に送り直した場合は上書きする。
+# upsert には migrations/001_conditions_player_date_unique.sql のユニークインデックスが要る（未適用の間は _upsert_by_key で 1 行ずつ書く）
+COND_CONFLICT = "player_name,date"
+
+def enqueue_condition(row):
+    _write_queue().enqueue("conditions", row, owner=st.session_state.get("user_name"), on_conflict=COND_CONFLICT)
+
+COMPACT_DELETE_CHUNK = 200
+
+def compact_conditions():
+    # (player_name, date) ごとに最新の 1 件（id 最大）だけを残し、それ以外をまとめて削除する。削除件数を返す
+    df = fetch_rows(supabase, "conditions", "id,player_name,date")
+    if df.empty: return 0
+    df = df.sort_values("id")
+    dup_ids = df.loc[df.duplicated(["player_name", "date"], keep="last"), "id"].astype(int).tolist()
+    for i in range(0, len(dup_ids), COMPACT_DELETE_CHUNK):
+        supabase.table("conditions").delete().in_("id", dup_ids[i:i + COMPACT_DELETE_CHUNK]).execute()
+    if dup_ids: invalidate_table("conditions", full=True)
+    return len(dup_ids)
+
+# シーズンアーカイブ。前シーズンまでの行を Parquet（season_archive.py）に書き出し、必要ならライブの DB から消して今シーズン分だけを残す。
+# 書き出しは月単位（cutoff は月初に丸める）なので、同じ期間を何度書き出しても結果は変わらない
+ARCHIVE_TABLES = list(ARCHIVE_SCHEMAS)
+
+def archive_cutoff(today=None):
+    return season_start(season_of(today or date.today()))
+
+def export_archive(table_name, cutoff, prune=False):
+    # cutoff より前の行を書き出す。(書き出した行数, ライブから削除した行数) を返す
+    cutoff = cutoff.replace(day=1)
+    df = fetch_rows(supabase, table_name, archive_columns(table_name), (("lt", "date", str(cutoff)),))
+    if df.empty: return 0, 0
+    written = write_archive(table_name, df)
+    if not prune: return written, 0
+    # 読み戻して確認できた行だけを消す
+    ids = df["id"][df["id"].isin(read_archive(table_name, ["id"], end=cutoff)["id"])]
+    if table_name == "physical_tests":
+        # 相対評価には各選手・各種目の最新値が要るので、最新の記録はライブに残す
+        df_all = fetch_rows(supabase, "physical_tests", "id,player_name,test_name,date")
+        latest = df_all.sort_values(["date", "id"]).drop_duplicates(["player_name", "test_name"], keep="last")["id"]
+        ids = ids[~ids.isin(latest)]
+    ids = [int(i) for i in ids]
+    for i in range(0, len(ids), COMPACT_DELETE_CHUNK):
+        supabase.table(table_name).delete().in_("id", ids[i:i + COMPACT_DELETE_CHUNK]).execute()
+    if ids: invalidate_table(table_name, full=True)
+    return written, len(ids)
+
+@st.cache_data(max_entries=32)
+def _read_archive(table_name, columns, players, start, end, version):
+    return read_archive(table_name, columns, players, start, end)
+
+def archived_rows(table_name, columns, players=None, start=None, end=None):
+    # アーカイブが書き換わるまでは全セッションで使い回す
+    return _read_archive(table_name, tuple(columns), tuple(players) if players is not None else None, start, end, archive_version(table_name))
+
+def with_archive(table_name, df_live, players=None):
+    # ライブの行にアーカイブ済みの過去分を足す（まだライブにも残っている行はライブ側を使う）。
+    # 書き出し後にライブから削除した行も、履歴・ストリーク・ポートフォリオの集計に含めるために使う
+    if not archive_version(table_name): return df_live
+    names = archive_columns(table_name).split(",")
+    past = archived_rows(table_name, [c for c in df_live.columns if c in names] if not df_live.empty else names, players)
+    if not df_live.empty: past = past[~past["id"].isin(df_live["id"])]
+    if past.empty: return df_live
+    return pd.concat([past, df_live], ignore_index=True).sort_values("date", kind="stable", ignore_index=True)
+
+def season_monthly(df, y):
+    # シーズン × 月の平均。x 軸はシーズンの開始月から並べる
+    d = pd.to_datetime(df["date"])
+    out = df[y].groupby([(d.dt.year - (d.dt.month < SEASON_START_MONTH)).rename("シーズン"), d.dt.month.rename("月")]).mean().reset_index()
+    out["シーズン"] = out["シーズン"].astype(str) + "年度"
+    out["order"] = (out["月"] - SEASON_START_MONTH) % 12
+    out["月"] = out["月"].astype(str) + "月"
+    return out.sort_values(["シーズン", "order"]).drop(columns="order")
+
+# 変更フィード。Supabase Realtime（ローカルでは LocalClient の publish）から行単位の insert / update / delete を受け取り、
+# テーブルキャッシュに積む（次の取得時にテーブルごとにまとめて当てる）。購読できている間はキャッシュの TTL を延ばし、再取得は取りこぼし対策の安全網にとどめる
+REALTIME_ENABLED = os.environ.get("TEAM_OPS_REALTIME", "on") != "off"
+REALTIME_TABLES = ["players", "conditions", "physical_tests", "injury_reports", "rehab_plans", "tactics_board"]
+REALTIME_CACHE_TTL = 300
+REALTIME_REFRESH_SECONDS = 5
+
+class ChangeFeed:
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.connected = False
+        self.events = 0
+        self.error = None
+
+    def start(self):
+        if isinstance(self.client, LocalClient):
+            self.client.subscribe(self.on_change)
+            self._set_state(True)
+        else:
+            threading.Thread(target=self._run_realtime, daemon=True).start()
+        return self
+
+    def _set_state(self, connected, error=None):
+        with self.lock:
+            self.connected, self.error = connected, error
+        self.cache.ttl = REALTIME_CACHE_TTL if connected else TABLE_CACHE_TTL
+
+    def on_change(self, payload):
+        data = payload.get("data", {})
+        if data.get("table") not in REALTIME_TABLES: return
+        self.cache.apply_change(data["table"], data.get("type"), data.get("record"), data.get("old_record"))
+        with self.lock: self.events += 1
+
+    def _run_realtime(self):
+        async def main():
+            rt = AsyncRealtimeClient(f"{SUPABASE_URL.rstrip('/')}/realtime/v1", SUPABASE_KEY)
+            await rt.connect()
+            channel = rt.channel("team-ops-hub")
+            for t in REALTIME_TABLES:
+                channel.on_postgres_changes("*", callback=self.on_change, table=t, schema="public")
+            await channel.subscribe(lambda state, err: self._set_state(state == RealtimeSubscribeStates.SUBSCRIBED, err))
+            while True: await asyncio.sleep(3600)
+        try:
+            asyncio.run(main())
+        except Exception as e:
+            self._set_state(False, e)
+
+    def summary(self):
+        with self.lock:
+            if self.connected: return f"🟢 変更フィード接続中 (受信 {self.events} 件)"
+            return f"⚪ 変更フィード未接続（{TABLE_CACHE_TTL} 秒ごとの差分取得で更新）" + (f": {self.error}" if self.error else "")
+
+@st.cache_resource
+def _change_feed():
+    feed = ChangeFeed(supabase, _table_cache())
+    return feed.start() if REALTIME_ENABLED else feed
+
+# 日別ロールアップ（日付 × ポジションごとの件数・合計・二乗和）。新しい行だけを積み上げ、チーム平均推移はここから描く
+ROLLUP_METRICS = ["fatigue", "sleep", "weight"]
+ROLLUP_FREQS = {"日": "D", "週": "W", "月": "MS"}
+
+def _rollup_rows(rows, positions):
+    keys = [rows["date"], rows["player_name"].map(positions).fillna("不明").rename("position")]
+    parts = {}
+    for m in ROLLUP_METRICS:
+        v = pd.to_numeric(rows[m], errors="coerce") if m in rows.columns else pd.Series(np.nan, index=rows.index)
+        g = v.groupby(keys)
+        parts[f"{m}_n"], parts[f"{m}_sum"], parts[f"{m}_sq"] = g.count(), g.sum(), (v ** 2).groupby(keys).sum()
+    return pd.DataFrame(parts)
+
+class DailyRollup:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.daily = pd.DataFrame()
+        self.max_id = 0
+        self.source = None
+
+    def sync(self, df_cond, df_players):
+        # df_cond は id 順に並んだ全件の conditions（テーブルキャッシュのもの）を渡す
+        positions = df_players.set_index("name")["position"] if not df_players.empty and "position" in df_players.columns else pd.Series(dtype=object)
+        source = (_table_cache().reset_count("conditions"), data_version("players"))
+        with self.lock:
+            if df_cond.empty or "id" not in df_cond.columns:
+                self.daily, self.max_id, self.source = pd.DataFrame(), 0, source
+            elif self.source != source:
+                self.daily, self.max_id, self.source = _rollup_rows(df_cond, positions), int(df_cond["id"].max()), source
+            else:
+                new = df_cond.iloc[df_cond["id"].searchsorted(self.max_id, side="right"):]
+                if not new.empty:
+                    self.daily = self.daily.add(_rollup_rows(new, positions), fill_value=0)
+                    self.max_id = int(new["id"].max())
+
+    def series(self, freq="D", position=None):
+        with self.lock:
+            daily = self.daily
+        if daily.empty: return pd.DataFrame(columns=["date"] + ROLLUP_METRICS)
+        d = daily.reset_index()
+        if position: d = d[d["position"] == position]
+        d["date"] = pd.to_datetime(d["date"])
+        agg = d.drop(columns="position").groupby(pd.Grouper(key="date", freq=freq)).sum()
+        out = pd.DataFrame(index=agg.index)
+        for m in ROLLUP_METRICS:
+            n = agg[f"{m}_n"].where(agg[f"{m}_n"] > 0)
+            out[m] = agg[f"{m}_sum"] / n
+            out[f"{m}_std"] = np.sqrt((agg[f"{m}_sq"] / n - out[m] ** 2).clip(lower=0))
+        return out.dropna(subset=ROLLUP_METRICS, how="all").reset_index()
+
+@st.cache_resource
+def _daily_rollup():
+    return DailyRollup()
+
+# 負荷指標。7日 / 28日の移動平均と EWMA、急性:慢性比 (ACWR = 疲労の EWMA7 / EWMA28) を全選手分まとめて計算する
+WORKLOAD_ACUTE_DAYS = 7
+WORKLOAD_CHRONIC_DAYS = 28
+WORKLOAD_SPANS = {"ewma_acute": WORKLOAD_ACUTE_DAYS, "ewma_chronic": WORKLOAD_CHRONIC_DAYS}
+
+def calculate_workload_metrics(df_cond, context=None, seeds=None):
+    # context: 移動平均の窓に入る直前の行（出力には含めない）、seeds: 選手ごとの直前の EWMA（続きから計算する）
+    d = df_cond[["id", "player_name", "date"] + ROLLUP_METRICS].assign(is_new=True)
+    if context is not None and not context.empty: d = pd.concat([context.assign(is_new=False), d], ignore_index=True)
+    d["date"] = pd.to_datetime(d["date"])
+    d = d.sort_values(["player_name", "date", "id"], kind="stable", ignore_index=True)
+    by_player = d.set_index("date").groupby("player_name", sort=False)[ROLLUP_METRICS]
+    out = d[["id", "player_name", "date"]].copy()
+    for days in (WORKLOAD_ACUTE_DAYS, WORKLOAD_CHRONIC_DAYS):
+        # ソート済みなので groupby().rolling() の結果は d と同じ並び
+        rolled = by_player.rolling(f"{days}D").mean()
+        for m in ROLLUP_METRICS: out[f"{m}_{days}d"] = rolled[m].values
+    out = out[d["is_new"]].reset_index(drop=True)
+    for col, span in WORKLOAD_SPANS.items():
+        x = out[["player_name"]].assign(v=pd.to_numeric(d.loc[d["is_new"], "fatigue"], errors="coerce").values, seed=False)
+        if seeds is not None and not seeds.empty:
+            seed = seeds.loc[seeds.index.intersection(x["player_name"].unique()), col]
+            x = pd.concat([pd.DataFrame({"player_name": seed.index, "v": seed.values, "seed": True}), x], ignore_index=True)
+        x = x.sort_values("player_name", kind="stable")
+        ewm = x.groupby("player_name", sort=False)["v"].ewm(span=span, adjust=False).mean().droplevel(0)
+        out[col] = ewm[~x["seed"]].sort_index().values
+    out["acwr"] = (out["ewma_acute"] / out["ewma_chronic"]).round(2)
+    return out
+
+class WorkloadMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.history = pd.DataFrame()
+        self.tail = pd.DataFrame()
+        self.max_id = 0
+        self.source = None
+
+    def _keep_tail(self, rows):
+        rows = rows[["id", "player_name", "date"] + ROLLUP_METRICS]
+        last = pd.to_datetime(rows.groupby("player_name")["date"].transform("max"))
+        return rows[pd.to_datetime(rows["date"]) > last - pd.Timedelta(days=WORKLOAD_CHRONIC_DAYS)]
+
+    def sync(self, df_cond):
+        # df_cond は id 順に並んだテーブルキャッシュの conditions。新しい行だけを前回の状態から続けて計算する
+        source = _table_cache().reset_count("conditions")
+        with self.lock:
+            if df_cond.empty or "id" not in df_cond.columns:
+                self.history, self.tail, self.max_id, self.source = pd.DataFrame(), pd.DataFrame(), 0, source
+                return
+            new = df_cond.iloc[df_cond["id"].searchsorted(self.max_id, side="right"):] if self.source == source else df_cond
+            if new.empty: return
+            if self.source == source and not self.history.empty:
+                last = self.history.groupby("player_name")["date"].max()
+                # 過去日付の行が後から入った場合は続きから計算できないので作り直す
+                if (pd.to_datetime(new["date"]).values < last.reindex(new["player_name"]).values).any(): new = df_cond
+            if new is df_cond:
+                self.history = calculate_workload_metrics(df_cond)
+                self.tail = self._keep_tail(df_cond)
+            else:
+                seeds = self.history.groupby("player_name")[list(WORKLOAD_SPANS)].last()
+                context = self.tail[self.tail["player_name"].isin(new["player_name"])]
+                self.history = pd.concat([self.history, calculate_workload_metrics(new, context, seeds)], ignore_index=True)
+                self.tail = self._keep_tail(pd.concat([self.tail, new], ignore_index=True))
+            self.max_id, self.source = int(df_cond["id"].max()), source
+
+    def latest(self):
+        with self.lock:
+            history = self.history
+        if history.empty: return history
+        return history.sort_values(["date", "id"]).groupby("player_name").tail(1).reset_index(drop=True)
+
+    def player_history(self, player_name):
+        with self.lock:
+            history = self.history
+        if history.empty: return history
+        return history[history["player_name"] == player_name].sort_values(["date", "id"])
+
+@st.cache_resource
+def _workload_metrics():
+    return WorkloadMetrics()
+
+# ロール別のクエリ計画。{テーブル名: (列, フィルタ)} を返し、絞り込みと列の選択は Supabase 側で行う（ロールが使わないテーブルは取得しない）
+PARENT_CATEGORY = "保護者向け資料 (PDF/画像)"
+COND_COLUMNS = "id,player_name,date,weight,fatigue,sleep"
+PHYS_COLUMNS = "id,player_name,test_name,value,date"
+TRAINER_COND_DAYS = 90
+
+def plan_queries(role, user_name):
+    if role == "admin":
+        return {"players": ("*", ()), "conditions": (COND_COLUMNS, ()), "physical_tests": (PHYS_COLUMNS, ()),
+                "injury_reports": ("*", ()), "rehab_plans": ("*", ())}
+    if role == "trainer":
+        since = str(date.today() - timedelta(days=TRAINER_COND_DAYS))
+        return {"players": ("id,name", ()), "conditions": (COND_COLUMNS, (("gte", "date", since),)),
+                "injury_reports": ("*", (("eq", "is_active", True),)),
+                "rehab_plans": ("id,injury_id,target_week_start,is_approved", ())}
+    me = (("eq", "player_name", user_name),)
+    return {
+        "players": ("*", (("eq", "name", user_name),)),
+        "conditions": (COND_COLUMNS, me),
+        # 相対評価にはチーム全体の最新値が必要なので、スコア計算に使う列だけを取得する
+        "physical_tests": (PHYS_COLUMNS, ()),
+        "injury_reports": ("id,player_name,injury_name,current_phase,target_return_date,is_active", me + (("eq", "is_active", True),)),
+        "rehab_plans": ("id,injury_id,target_week_start,menu_description,is_approved", (("eq", "is_approved", True),)),
+    }
+
+# 戦術ボードは全件を読み込まず、新しい順に TACTICS_PAGE_SIZE 件ずつ id のカーソルで辿る（ロールのカテゴリ絞り込みもサーバー側）。
+# Supabase 側には次のインデックスを用意しておく: create index on tactics_board (category, id desc);
+TACTICS_PAGE_SIZE = 10
+TACTICS_COLUMNS = "id,category,title,description,media_url,media_type"
+TACTICS_CATEGORIES = ["自チームの戦術モデル", "対戦相手スカウティング", PARENT_CATEGORY, "その他（モチベーション等）"]
+
+def tactics_filters(role, category=None):
+    if category: return (("eq", "category", category),)
+    if role == "parent": return (("eq", "category", PARENT_CATEGORY),)
+    if role == "player": return (("neq", "category", PARENT_CATEGORY),)
+    return ()
+
+@st.cache_data(ttl=TABLE_CACHE_TTL, max_entries=64)
+def _tactics_page(filters, cursor, version):
+    query = supabase.table("tactics_board").select(TACTICS_COLUMNS)
+    for op, col, val in filters:
+        query = getattr(query, op)(col, val)
+    if cursor is not None: query = query.lt("id", cursor)
+    # 1 件多く取り、次のページがあるかどうかを判定する
+    rows = query.order("id", desc=True).limit(TACTICS_PAGE_SIZE + 1).execute().data
+    return pd.DataFrame(rows[:TACTICS_PAGE_SIZE]), (rows[TACTICS_PAGE_SIZE - 1]["id"] if len(rows) > TACTICS_PAGE_SIZE else None)
+
+def tactics_page(filters, cursor=None):
+    # (そのページの行, 次のページのカーソル) を返す。投稿・削除でデータバージョンが変わるまでは全セッションで使い回す
+    return _tactics_page(filters, cursor, data_version("tactics_board"))
+
+def youtube_id(url):
+    m = re.search(r"(?:youtu\.be/|[?&]v=|/shorts/|/embed/|/live/)([\w-]{11})", str(url or ""))
+    return m.group(1) if m else None
+
+def show_tactics_feed(role, key, deletable=False):
+    cat = st.selectbox("カテゴリー", ["すべて"] + (TACTICS_CATEGORIES if role == "admin" else [c for c in TACTICS_CATEGORIES if c != PARENT_CATEGORY]), key=f"{key}_cat") if role != "parent" else "すべて"
+    filters = tactics_filters(role, None if cat == "すべて" else cat)
+    # カーソルの履歴はカテゴリごとに持つ（「前へ」は 1 つ戻すだけ）
+    cursors = st.session_state.setdefault(f"{key}_cursors_{cat}", [None])
+    try:
+        df, next_cursor = tactics_page(filters, cursors[-1])
+    except Exception as e:
+        st.error(f"読み込みに失敗しました: {e}")
+        return
+    if df.empty:
+        st.info("現在共有されているコンテンツはありません。")
+    for _, row in df.iterrows():
+        with st.container(border=True):
+            st.markdown(f"**[{row['category']}] {row['title']}**")
+            if row.get('description'):
+                st.markdown(f"📝 {row['description']}")
+            vid = youtube_id(row['media_url']) if row['media_type'] != "document" else None
+            if row['media_type'] == "document":
+                st.markdown(f"<a href='{row['media_url']}' target='_blank' class='doc-link-btn'>📄 {row['title']} を開く</a>", unsafe_allow_html=True)
+            elif vid:
+                # 最初はサムネイルだけを表示し、押された動画だけプレーヤーを埋め込む
+                if st.session_state.get(f"{key}_play_{row['id']}"):
+                    st.video(row['media_url'])
+                else:
+                    st.image(f"https://img.youtube.com/vi/{vid}/hqdefault.jpg", width=320)
+                    if st.button("▶ 再生", key=f"{key}_btn_{row['id']}"):
+                        st.session_state[f"{key}_play_{row['id']}"] = True
+                        st.rerun()
+            else: st.write(row['media_url'])
+            if deletable and st.button("この投稿を削除", key=f"del_tac_{row['id']}"):
+                supabase.table("tactics_board").delete().eq("id", row['id']).execute()
+                invalidate_table("tactics_board", full=True)
+                st.rerun()
+    c1, c2, c3 = st.columns([1, 2, 1])
+    with c1:
+        if len(cursors) > 1 and st.button("← 新しい投稿", key=f"{key}_prev"):
+            cursors.pop()
+            st.rerun()
+    with c2: st.caption(f"{len(cursors)} ページ目")
+    with c3:
+        if next_cursor is not None and st.button("過去の投稿 →", key=f"{key}_next"):
+            cursors.append(next_cursor)
+            st.rerun()
+
+# 起動時の並列取得。テーブルごとのタイムアウトを超えたものは空のまま描画し、取得は裏で続けて次回の再描画で使う
+TABLE_FETCH_TIMEOUT = 5
+TABLE_FETCH_TIMEOUTS = {"conditions": 10, "physical_tests": 10}
+
+def load_tables(query_plan):
+    cache = _table_cache()
+    pool = ThreadPoolExecutor(max_workers=max(1, len(query_plan)))
+    started = time.time()
+    futures = {t: pool.submit(cache.fetch, supabase, t, cols, flt) for t, (cols, flt) in query_plan.items()}
+    pool.shutdown(wait=False)
+    # 時間切れのテーブルは slow、取得に失敗したテーブルは failed ({テーブル: 例外}) で返す（どちらも空の DataFrame を入れておく）
+    tables, slow, failed = {}, [], {}
+    for t, fut in futures.items():
+        remaining = started + TABLE_FETCH_TIMEOUTS.get(t, TABLE_FETCH_TIMEOUT) - time.time()
+        try:
+            tables[t] = fut.result(timeout=max(0, remaining))
+        except FuturesTimeout:
+            tables[t] = pd.DataFrame()
+            slow.append(t)
+        except Exception as e:
+            tables[t] = pd.DataFrame()
+            failed[t] = e
+    return tables, slow, failed
+
+# タブ単位の遅延取得。開いているタブが使うテーブルだけを取得・計算し、同じ再描画の中ではメモ化する
+class LazyTables:
+    def __init__(self, query_plan):
+        self.plan = query_plan
+        self.loaded = {}
+        self.memos = {}
+        self.failed = set()  # 時間切れ・失敗で空の DataFrame を入れたテーブル
+
+    def get(self, *names):
+        todo = {t: self.plan[t] for t in names if t in self.plan and t not in self.loaded}
+        if todo:
+            tables, slow, failed = load_tables(todo)
+            self.loaded.update(tables)
+            self.failed.update(slow, failed)
+            if slow: st.warning(f"⏳ 一部のデータ ({', '.join(slow)}) の読み込みに時間がかかっています。再読み込みすると表示されます。")
+            for t, e in failed.items(): st.error(f"データ ({t}) の読み込みに失敗しました: {e}")
+        dfs = tuple(self.loaded.get(t, pd.DataFrame()) for t in names)
+        return dfs[0] if len(dfs) == 1 else dfs
+
+    def memo(self, key, func):
+        if key not in self.memos: self.memos[key] = func()
+        return self.memos[key]
+
+# リハビリ計画 ⨝ 故障情報。テーブルのデータバージョンごとに 1 度だけ結合し、トレーナー・管理者・選手の画面で使い回す。
+# TEAM_OPS_REHAB_JOIN=server の場合は埋め込み select でストレージ側に結合させる（rehab_plans.injury_id → injury_reports.id の外部キーが必要）
+REHAB_SERVER_JOIN = os.environ.get("TEAM_OPS_REHAB_JOIN") == "server"
+REHAB_INJURY_COLUMNS = ["player_name", "injury_name", "current_phase", "target_return_date", "is_active"]
+
+def join_rehab(df_rehab, df_injury):
+    if df_rehab.empty or df_injury.empty or "injury_id" not in df_rehab.columns: return pd.DataFrame()
+    inj = df_injury[["id"] + [c for c in REHAB_INJURY_COLUMNS if c in df_injury.columns]].rename(columns={"id": "injury_id"})
+    view = df_rehab.merge(inj, on="injury_id", how="inner", validate="many_to_one")
+    # 選手ごとに新しい週から並べておき、呼び出し側は絞り込んで先頭を取るだけにする
+    return view.sort_values(["player_name", "target_week_start", "id"], ascending=[True, False, False], ignore_index=True)
+
+def _flatten_rehab(df):
+    if df.empty or "injury_reports" not in df.columns: return pd.DataFrame()
+    inj = pd.DataFrame(df["injury_reports"].tolist(), index=df.index)
+    view = pd.concat([df.drop(columns="injury_reports"), inj], axis=1)
+    return view.sort_values(["player_name", "target_week_start", "id"], ascending=[True, False, False], ignore_index=True)
+
+@st.cache_data(max_entries=16)
+def _rehab_view(versions, plans, _df_rehab, _df_injury):
+    return _flatten_rehab(_df_rehab) if _df_injury is None else join_rehab(_df_rehab, _df_injury)
+
+def rehab_view(lazy):
+    if "rehab_plans" not in lazy.plan or "injury_reports" not in lazy.plan: return pd.DataFrame()
+    plans = (lazy.plan["rehab_plans"], lazy.plan["injury_reports"])
+    if REHAB_SERVER_JOIN:
+        (cols, flt), (_, inj_flt) = plans
+        # 故障情報側の絞り込みは埋め込み先へのフィルタとして渡す（クライアント側の inner join と同じ結果になる）
+        flt = tuple(flt) + tuple((op, f"injury_reports.{col}", val) for op, col, val in inj_flt)
+        df = fetch_table_as_df("rehab_plans", f"{cols},injury_reports!inner({','.join(REHAB_INJURY_COLUMNS)})", flt)
+        # 取得に失敗した場合も空が返るので、空の結果はキャッシュしない（同じバージョンの間、全セッションに空の一覧が出続けるため）
+        if df.empty: return _flatten_rehab(df)
+        return _rehab_view((data_version("rehab_plans"),), plans, df, None)
+    df_rehab, df_injury = lazy.get("rehab_plans", "injury_reports")
+    if df_rehab.empty or df_injury.empty or lazy.failed & {"rehab_plans", "injury_reports"}: return join_rehab(df_rehab, df_injury)
+    return _rehab_view((data_version("rehab_plans"), data_version("injury_reports")), plans, df_rehab, df_injury)
+
+def select_tab(labels, key):
+    # st.tabs は全タブの中身を毎回実行してしまうため、選択中のタブだけを実行するラジオで切り替える
+    return st.radio("メニュー", labels, horizontal=True, label_visibility="collapsed", key=key)
+
+# 管理者の名簿。検索キーは選手データのバージョンごとに 1 度だけ作り、表示は 1 ページ分・編集フォームは選択中の 1 人分だけにする
+ROSTER_PAGE_SIZE = 20
+
+@st.cache_data(max_entries=4)
+def _roster_index(version, n_rows, _df_players):
+    df = _df_players.sort_values(["number", "name"]).reset_index(drop=True)
+    num = df["number"].astype(str)
+    df["search_key"] = "no." + num + " #" + num + " " + df["name"].astype(str).str.lower() + " " + df["position"].astype(str).str.lower()
+    return df
+
+def search_roster(df_players, query="", positions=()):
+    df = _roster_index(data_version("players"), len(df_players), df_players)
+    mask = pd.Series(True, index=df.index)
+    for term in str(query).lower().split():
+        mask &= df["search_key"].str.contains(term, regex=False)
+    if positions: mask &= df["position"].isin(positions)
+    return df[mask]
+
+def changed_fields(row, values):
+    # 現在の値から変わった列だけを返す（数値は誤差を無視して比べる）
+    out = {}
+    for k, v in values.items():
+        old = row.get(k)
+        if isinstance(v, float) and old is not None and not pd.isna(old) and abs(float(old) - v) < 1e-6: continue
+        if not isinstance(v, float) and old == v: continue
+        out[k] = v
+    return out
+
+# 推移グラフ。点数が CHART_MAX_POINTS を超える場合は週平均 → 月平均の順に粗くしてから描き、
+# 作った図は (グラフの種類, 選手, 指標, データバージョン, 期間) をキーに全セッションで使い回す
+CHART_MAX_POINTS = 180
+CHART_FREQS = [("W", "週平均"), ("MS", "月平均")]
+FIGURE_CACHE_SIZE = 128
+
+def downsample(df, y, x="date", max_points=CHART_MAX_POINTS):
+    # (描画するデータ, 集計単位の表示名) を返す。間引かなかった場合の表示名は None
+    if len(df) <= max_points: return df, None
+    series = df.assign(**{x: pd.to_datetime(df[x])}).set_index(x)[y]
+    for freq, label in CHART_FREQS:
+        out = series.resample(freq).mean().dropna(how="all")
+        if len(out) <= max_points: break
+    return out.reset_index(), label
+
+class FigureCache:
+    def __init__(self, size=FIGURE_CACHE_SIZE):
+        self.lock = threading.Lock()
+        self.size = size
+        self.figures = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        with self.lock:
+            if key in self.figures:
+                self.figures.move_to_end(key)
+                self.hits += 1
+                return self.figures[key]
+            self.misses += 1
+        fig = build()
+        with self.lock:
+            self.figures[key] = fig
+            while len(self.figures) > self.size: self.figures.popitem(last=False)
+        return fig
+
+    def summary(self):
+        with self.lock:
+            return f"グラフキャッシュ {len(self.figures)} 件 / ヒット {self.hits} 回・作成 {self.misses} 回"
+
+@st.cache_resource
+def _figure_cache():
+    return FigureCache()
+
+def trend_chart(table_name, key, df, y, x="date", title=None, **px_kwargs):
+    if df.empty: return
+    cache_key = (table_name, key, tuple(y) if isinstance(y, list) else y, data_version(table_name), len(df), str(df[x].iloc[0]), str(df[x].iloc[-1]))
+    def build():
+        data, label = downsample(df, y, x)
+        full_title = f"{title or ''}（{label}）" if label else title
+        return px.line(data, x=x, y=y, markers=True, title=full_title, **px_kwargs)
+    st.plotly_chart(_figure_cache().get(cache_key, build), use_container_width=True)
+
+def show_condition_charts(player_name, p_cond, headings=False):
+    # トレーナー・管理者・選手の画面で共通のコンディション推移と体重推移
+    df = p_cond.rename(columns={"fatigue": "疲労度", "sleep": "睡眠の質", "weight": "体重"})
+    if headings: st.markdown("#### コンディション推移")
+    trend_chart("conditions", (player_name, "fatigue_sleep"), df, ["疲労度", "睡眠の質"], range_y=[0, 6], color_discrete_map=COLOR_MAP)
+    if headings: st.markdown("#### 体重推移")
+    trend_chart("conditions", (player_name, "weight"), df, "体重")
+
 def calculate_bmi(height_cm, weight_kg):
     if height_cm > 0:
         height_m = height_cm / 100
         return round(weight_kg / (height_m ** 2), 1)
     return 0
 
-def calculate_streak(player_name, df_cond):
-    if df_cond.empty or "player_name" not in df_cond.columns:
-        return 0
-    p_cond = df_cond[df_cond["player_name"] == player_name]
-    if p_cond.empty: return 0
-    input_dates = set(pd.to_datetime(p_cond["date"]).dt.date)
-    today = date.today()
-    streak = 0
-    check_date = today
-    for _ in range(100):
-        if check_date.weekday() in [0, 5, 6]:
-            check_date -= timedelta(days=1)
-            continue
-        if check_date in input_dates: streak += 1
-        else:
-            if check_date != today: break
-        check_date -= timedelta(days=1)
-    return streak
+def show_condition_alerts(df_cond, thresholds=None):
+    alerts = detect_condition_alerts(df_cond, thresholds)
+    for p, r in zip(alerts["player_name"], alerts["理由"]):
+        st.error(f"**{p}**: {r}")
+
+def show_live_alerts(cond_plan, thresholds=None):
+    # 変更フィードに接続している間は、アラート欄だけを REALTIME_REFRESH_SECONDS ごとに描き直す（ページ全体は再実行しない）
+    feed = _change_feed()
+    def body():
+        df_cond = fetch_table_as_df("conditions", *cond_plan)
+        if not df_cond.empty and "player_name" in df_cond.columns: show_condition_alerts(df_cond, thresholds)
+        if feed.connected: st.caption(f"🟢 リアルタイム更新中（{datetime.now():%H:%M:%S} 時点）")
+    st.fragment(body, run_every=REALTIME_REFRESH_SECONDS if feed.connected else None)()
+
+@st.cache_data(max_entries=8)
+def _physical_score_matrix(version, n_rows, _df_phys):
+    return calculate_physical_score_matrix(_df_phys)
+
+def physical_score_matrix(df_phys):
+    # データのバージョンが変わるまでは全セッションで使い回す
+    return _physical_score_matrix(data_version("physical_tests"), len(df_phys), df_phys)
 
 def calculate_physical_score(player_name, df_phys):
-    if df_phys.empty or "test_name" not in df_phys.columns: return pd.DataFrame()
-    latest_phys = df_phys.sort_values("date").drop_duplicates(subset=["player_name", "test_name"], keep="last")
-    scores = []
-    for test in PHYS_TESTS:
-        test_data = latest_phys[latest_phys["test_name"] == test]
-        if test_data.empty: continue
-        p_data = test_data[test_data["player_name"] == player_name]
-        if p_data.empty: continue
-        p_val = float(p_data.iloc[0]["value"])
-        max_val = float(test_data["value"].max())
-        min_val = float(test_data["value"].min())
-        if max_val == min_val: score = 70
-        else:
-            if "秒" in test: score = 100 * (max_val - p_val) / (max_val - min_val)
-            else: score = 100 * (p_val - min_val) / (max_val - min_val)
-        score = max(20, min(100, int(score)))
-        short_name = test.replace(" (秒)", "").replace(" (cm)", "").replace(" (m)", "")
-        scores.append({"テスト": short_name, "スコア": score, "実数値": p_val, "単位": test.split()[-1] if " " in test else ""})
-    return pd.DataFrame(scores)
+    matrix = physical_score_matrix(df_phys)
+    return matrix[matrix["player_name"] == player_name].drop(columns="player_name").reset_index(drop=True)
+
+def portfolio_items(df_players, df_cond, df_phys):
+    # 全選手分のポートフォリオの中身を、チーム全体の集計（ストリーク・スコア・平均）から一度に組み立てる。
+    # ワーカープロセスへ渡すので、pandas / numpy の型は含めず素の dict にする
+    if df_players.empty: return []
+    df_cond = with_archive("conditions", df_cond)
+    has_cond = not df_cond.empty and "player_name" in df_cond.columns
+    streaks = calculate_streaks(df_cond).set_index("player_name") if has_cond else pd.DataFrame(columns=["current_streak", "longest_streak"])
+    stats = df_cond.groupby("player_name").agg(total=("date", "size"), sleep=("sleep", "mean"), fatigue=("fatigue", "mean")) if has_cond else pd.DataFrame(columns=["total", "sleep", "fatigue"])
+    matrix = physical_score_matrix(df_phys)
+    radars = {name: [{"test": t, "score": int(s), "value": float(v), "unit": u} for t, s, v, u in zip(g["テスト"], g["スコア"], g["実数値"], g["単位"])]
+              for name, g in matrix.groupby("player_name", sort=False)}
+    generated = date.today().strftime("%Y-%m-%d")
+    items = []
+    for p in df_players.itertuples(index=False):
+        st_row = streaks.loc[p.name] if p.name in streaks.index else None
+        c_row = stats.loc[p.name] if p.name in stats.index else None
+        items.append({
+            "name": p.name, "number": int(p.number), "position": p.position,
+            "height": float(p.height), "weight": float(p.weight), "bmi": calculate_bmi(float(p.height), float(p.weight)),
+            "total_inputs": int(c_row["total"]) if c_row is not None else 0,
+            "avg_sleep": round(float(c_row["sleep"]), 1) if c_row is not None else "-",
+            "avg_fatigue": round(float(c_row["fatigue"]), 1) if c_row is not None else "-",
+            "streak": int(st_row["current_streak"]) if st_row is not None else 0,
+            "longest_streak": int(st_row["longest_streak"]) if st_row is not None else 0,
+            "radar": radars.get(p.name, []), "generated": generated,
+        })
+    return items
+
+# ファイル一括取り込み（CSV / Excel）。見出しは日本語・英語のどちらでもよい
+IMPORT_CHUNK = 500
+IMPORT_COLUMNS = {
+    "physical_tests": {"選手名": "player_name", "種目": "test_name", "数値": "value", "測定日": "date"},
+    "conditions": {"選手名": "player_name", "日付": "date", "体重": "weight", "疲労": "fatigue", "睡眠": "sleep", "怪我": "injury", "痛みの詳細": "injury_detail"},
+}
+IMPORT_REQUIRED = {"physical_tests": ["player_name", "test_name", "value", "date"], "conditions": ["player_name", "date", "fatigue", "sleep"]}
+
+def read_import_file(file):
+    raw = file.getvalue()
+    if file.name.lower().endswith(".xlsx"): return pd.read_excel(io.BytesIO(raw))
+    # Excel で保存した CSV は Shift_JIS のことが多い
+    for enc in ("utf-8-sig", "cp932"):
+        try: return pd.read_csv(io.BytesIO(raw), encoding=enc)
+        except UnicodeDecodeError: continue
+    raise ValueError("文字コードを判別できませんでした（UTF-8 か Shift_JIS で保存してください）")
+
+def validate_import(table_name, df, player_names):
+    # 行ごとのループを使わず列単位でまとめて検査し、(取り込める行, エラー一覧) を返す
+    df = df.rename(columns=lambda c: IMPORT_COLUMNS[table_name].get(str(c).strip(), str(c).strip()))
+    missing = [c for c in IMPORT_REQUIRED[table_name] if c not in df.columns]
+    if missing:
+        inv = {v: k for k, v in IMPORT_COLUMNS[table_name].items()}
+        return pd.DataFrame(), pd.DataFrame({"行": [None], "理由": [f"列がありません: {', '.join(inv[c] for c in missing)}"]})
+    df = df[[c for c in IMPORT_COLUMNS[table_name].values() if c in df.columns]].copy()
+    df["player_name"] = df["player_name"].astype(str).str.strip()
+    dates = pd.to_datetime(df["date"], errors="coerce", format="mixed")
+    df["date"] = dates.dt.strftime("%Y-%m-%d")
+    reasons = {"選手名が登録されていません": ~df["player_name"].isin(set(player_names)), "日付が読めません": dates.isna()}
+    if table_name == "physical_tests":
+        df["test_name"] = df["test_name"].astype(str).str.strip()
+        df["value"] = pd.to_numeric(df["value"], errors="coerce")
+        reasons["種目が PHYS_TESTS にありません"] = ~df["test_name"].isin(PHYS_TESTS)
+        reasons["数値が読めません"] = df["value"].isna()
+    else:
+        for c in ("fatigue", "sleep"):
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+            label = '疲労' if c == 'fatigue' else '睡眠'
+            reasons[f"{label}は 1〜5 で入力してください"] = ~df[c].between(1, 5)
+            # int への変換で小数が黙って切り捨てられないよう、整数でない値はここで弾く
+            reasons[f"{label}は整数で入力してください"] = df[c].notna() & (df[c] % 1 != 0)
+        if "weight" in df.columns: df["weight"] = pd.to_numeric(df["weight"], errors="coerce")
+        df["injury"] = df["injury"].fillna("なし").astype(str) if "injury" in df.columns else "なし"
+        df["injury_detail"] = df["injury_detail"].fillna("").astype(str) if "injury_detail" in df.columns else ""
+    bad = pd.DataFrame(reasons)
+    errors = bad[bad.any(axis=1)]
+    errors = pd.DataFrame({"行": errors.index + 2, "理由": errors.apply(lambda r: "、".join(r.index[r]), axis=1)}) if not errors.empty else pd.DataFrame(columns=["行", "理由"])
+    valid = df[~bad.any(axis=1)]
+    if table_name == "conditions":
+        # 1 人 1 日 1 件なので、同じ選手・日付の行はファイルの後ろの行だけを取り込み、前の行はエラー一覧に載せる
+        last = valid.index.to_series().groupby([valid["player_name"], valid["date"]]).transform("max")
+        dup = last[last != last.index]
+        if not dup.empty:
+            dups = pd.DataFrame({"行": dup.index + 2, "理由": [f"同じ選手・日付の行が {r + 2} 行目にあるため、そちらを取り込みます" for r in dup]})
+            errors = pd.concat([errors, dups], ignore_index=True).sort_values("行", ignore_index=True)
+        valid = valid.drop(dup.index).astype({"fatigue": int, "sleep": int})
+    return valid, errors
+
+def bulk_write(table_name, df, on_conflict=None, progress=None):
+    # IMPORT_CHUNK 行ずつまとめて書き、チャンクごとに progress(書いた件数, 全件数) を呼ぶ
+    rows = df.astype(object).where(df.notna(), None).to_dict("records")
+    written = []
+    for i in range(0, len(rows), IMPORT_CHUNK):
+        res = _write_rows(supabase, table_name, rows[i:i + IMPORT_CHUNK], on_conflict)
+        written += res.data or []
+        if progress: progress(min(i + IMPORT_CHUNK, len(rows)), len(rows))
+    if on_conflict: _table_cache().patch(table_name, written)
+    else: invalidate_table(table_name)
+    return len(rows)
+
+def show_bulk_import(table_name, player_names, key):
+    inv = {v: k for k, v in IMPORT_COLUMNS[table_name].items()}
+    template = pd.DataFrame(columns=[inv[c] for c in IMPORT_COLUMNS[table_name].values()])
+    st.download_button("📄 テンプレート (CSV)", template.to_csv(index=False).encode("utf-8-sig"), f"{table_name}_template.csv", "text/csv", key=f"{key}_tpl")
+    up = st.file_uploader("CSV / Excel ファイル", type=["csv", "xlsx"], key=f"{key}_file")
+    if up is None: return
+    try:
+        valid, errors = validate_import(table_name, read_import_file(up), player_names)
+    except Exception as e:
+        st.error(f"ファイルを読み込めませんでした: {e}")
+        return
+    st.caption(f"取り込み可能: {len(valid)} 件 / エラー: {len(errors)} 件")
+    if not errors.empty:
+        st.dataframe(errors, hide_index=True, use_container_width=True)
+    if not valid.empty:
+        st.dataframe(valid.head(20), hide_index=True, use_container_width=True)
+        if st.button(f"{len(valid)} 件を取り込む", key=f"{key}_go", use_container_width=True):
+            bar = st.progress(0.0, text="取り込み中...")
+            try:
+                n = bulk_write(table_name, valid, COND_CONFLICT if table_name == "conditions" else None, lambda done, total: bar.progress(done / total, text=f"{done} / {total} 件"))
+                st.success(f"✅ {n} 件を取り込みました")
+            except Exception as e:
+                st.error(f"取り込みに失敗しました（途中のチャンクまでは保存されています）: {e}")
+
+# 選手写真は向きを直して表示用とサムネイル用に縮小し、元画像の sha256 をファイル名にする。
+# 同じ写真の再アップロードは既存のファイルを使い回し、名前が内容で決まるのでブラウザ側に長期キャッシュさせられる
+IMAGE_BUCKET = "player_images"
+IMAGE_DISPLAY_SIZE = 800
+IMAGE_THUMB_SIZE = 240
+IMAGE_CACHE_SECONDS = 31536000
+
+def process_image(raw):
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(raw))).convert("RGB")
+    display = img.copy()
+    display.thumbnail((IMAGE_DISPLAY_SIZE, IMAGE_DISPLAY_SIZE), Image.LANCZOS)
+    thumb = ImageOps.fit(img, (IMAGE_THUMB_SIZE, IMAGE_THUMB_SIZE), Image.LANCZOS)
+    out = []
+    for im, quality in ((display, 85), (thumb, 80)):
+        buf = io.BytesIO()
+        im.save(buf, "JPEG", quality=quality, optimize=True, progressive=True)
+        out.append(buf.getvalue())
+    return out[0], out[1], hashlib.sha256(raw).hexdigest()[:32]
+
+def _public_url(bucket, name):
+    res = supabase.storage.from_(bucket).get_public_url(name)
+    if isinstance(res, str): return res
+    return getattr(res, 'public_url', str(res))
+
+def thumbnail_url(image_val):
+    # img_<hash>.jpg のサムネイルは img_<hash>_thumb.jpg。古い形式の URL はそのまま返す
+    val = str(image_val or "")
+    base, q = val.split("?", 1) if "?" in val else (val, "")
+    if not os.path.basename(base).startswith("img_") or not base.endswith(".jpg") or base.endswith("_thumb.jpg"): return val
+    return base[:-4] + "_thumb.jpg" + (f"?{q}" if q else "")
+
+def store_image(raw):
+    display, thumb, digest = process_image(raw)
+    bucket = supabase.storage.from_(IMAGE_BUCKET)
+    name = f"img_{digest}.jpg"
+    existing = {f.get("name") for f in bucket.list("", {"search": f"img_{digest}"}) or []}
+    opts = {"content-type": "image/jpeg", "cache-control": str(IMAGE_CACHE_SECONDS), "upsert": "true"}
+    if name not in existing: bucket.upload(name, display, opts)
+    if f"img_{digest}_thumb.jpg" not in existing: bucket.upload(f"img_{digest}_thumb.jpg", thumb, opts)
+    return _public_url(IMAGE_BUCKET, name)
 
 def upload_image_to_supabase(file, prefix="player"):
     try:
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        safe_file_name = f"{prefix}_{timestamp}.jpg"
-        bucket_name = "player_images"
-        file_bytes = file.getvalue()
-        supabase.storage.from_(bucket_name).upload(safe_file_name, file_bytes, {"content-type": file.type, "upsert": "true"})
-        res = supabase.storage.from_(bucket_name).get_public_url(safe_file_name)
-        if isinstance(res, str): return res
-        return getattr(res, 'public_url', str(res))
+        return store_image(file.getvalue())
     except Exception as e:
         st.error(f"画像アップロードエラー: {e}")
         return None
 
-def upload_document_to_supabase(file):
+def migrate_player_images(df_players):
+    # 旧形式（元画像そのまま）の写真を取り込み直してサムネイルを作る。移行した人数を返す
+    done = 0
+    for _, row in df_players.iterrows():
+        val = str(row.get("image_url") or "")
+        if not val or thumbnail_url(val) != val or val.endswith("_thumb.jpg"): continue
+        if val.startswith("http"): raw = httpx.get(val, timeout=30, follow_redirects=True).raise_for_status().content
+        elif os.path.exists(val):
+            with open(val, "rb") as f: raw = f.read()
+        else: continue
+        supabase.table("players").update({"image_url": store_image(raw)}).eq("id", row["id"]).execute()
+        done += 1
+    if done: invalidate_table("players", full=True)
+    return done
+
+# 資料は Supabase Storage の再開可能アップロード (TUS) で UPLOAD_CHUNK_SIZE ずつ送る。
+# 一度に読むのは 1 チャンク分だけで、途中で失敗したら受信済みのオフセットを問い合わせて続きから送り直す
+UPLOAD_CHUNK_SIZE = 6 * 1024 * 1024  # Supabase の再開可能アップロードはこのサイズ固定
+UPLOAD_MAX_RETRIES = 5
+DOCUMENT_BUCKET = "club_documents"
+
+class TusBucket:
+    """Supabase の /storage/v1/upload/resumable。LocalBucket の create_upload / upload_offset / upload_chunk と同じ形で使う"""
+
+    def __init__(self, client, url, key, bucket):
+        self.client = client
+        self.endpoint = f"{url.rstrip('/')}/storage/v1/upload/resumable"
+        self.bucket = bucket
+        self.headers = {"Authorization": f"Bearer {key}", "apikey": key, "Tus-Resumable": "1.0.0"}
+
+    def create_upload(self, path, length, file_options=None):
+        opts = file_options or {}
+        meta = {"bucketName": self.bucket, "objectName": path, "contentType": opts.get("content-type", "application/octet-stream"), "cacheControl": opts.get("cache-control", "3600")}
+        res = self.client.post(self.endpoint, headers=dict(self.headers, **{
+            "Upload-Length": str(length),
+            "Upload-Metadata": ",".join(f"{k} {base64.b64encode(str(v).encode()).decode()}" for k, v in meta.items()),
+            "x-upsert": str(opts.get("upsert", "false")).lower(),
+        }))
+        res.raise_for_status()
+        return urljoin(self.endpoint + "/", res.headers["Location"])
+
+    def upload_offset(self, upload_id):
+        res = self.client.head(upload_id, headers=self.headers)
+        res.raise_for_status()
+        return int(res.headers["Upload-Offset"])
+
+    def upload_chunk(self, upload_id, offset, data):
+        res = self.client.patch(upload_id, content=data, headers=dict(self.headers, **{"Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"}))
+        res.raise_for_status()
+        return int(res.headers["Upload-Offset"])
+
+def _resumable_bucket(bucket_name):
+    if isinstance(supabase, LocalClient): return supabase.storage.from_(bucket_name)
+    return TusBucket(_http_client(), SUPABASE_URL, SUPABASE_KEY, bucket_name)
+
+def _upload_retryable(e):
+    # 409 は受信済みオフセットとのずれ。問い合わせ直せば続きから送れる
+    if isinstance(e, httpx.HTTPStatusError): return e.response.status_code >= 500 or e.response.status_code in (409, 429)
+    return _is_transient(e)
+
+class UploadStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.uploads = deque(maxlen=50)
+
+    def record(self, name, size, sent, seconds, chunks, retries, ok):
+        with self.lock:
+            self.uploads.append({"file": name, "MB": round(size / 1e6, 2), "送信 MB": round(sent / 1e6, 2), "秒": round(seconds, 1),
+                                 "MB/s": round(sent / 1e6 / seconds, 2) if seconds > 0 else None, "チャンク": chunks, "再試行": retries, "成功": ok})
+
+    def df(self):
+        with self.lock:
+            return pd.DataFrame(list(self.uploads))
+
+@st.cache_resource
+def _upload_stats():
+    return UploadStats()
+
+def _upload_fingerprint(file, size):
+    # 名前とサイズが同じ別ファイルを他人の途中アップロードに続けて送らないよう、先頭と末尾のチャンクの sha256 も照合に使う
+    h = hashlib.sha256()
+    for offset in sorted({0, max(0, size - UPLOAD_CHUNK_SIZE)}):
+        file.seek(offset)
+        h.update(file.read(UPLOAD_CHUNK_SIZE))
+    return h.hexdigest()
+
+def resumable_upload(bucket_name, path, file, file_options=None, progress=None):
+    # 失敗後に同じファイルを選び直した場合は、セッションに覚えておいた upload_id で続きから送る。保存先のパスを返す
+    target = _resumable_bucket(bucket_name)
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    key = (bucket_name, getattr(file, "name", path), size, _upload_fingerprint(file, size))
+    pending = st.session_state.setdefault("pending_uploads", {})
+    path, upload_id = pending.get(key, (path, None))
+    offset = None
+    if upload_id is not None:
+        try: offset = target.upload_offset(upload_id)
+        except Exception: upload_id = None
+    if upload_id is None:
+        upload_id, offset = target.create_upload(path, size, file_options), 0
+        pending[key] = (path, upload_id)
+    started, sent, chunks, retries = time.time(), 0, 0, 0
+    while True:
+        try:
+            if offset is None: offset = target.upload_offset(upload_id)
+            if offset >= size: break
+            file.seek(offset)
+            chunk = file.read(UPLOAD_CHUNK_SIZE)
+            offset = target.upload_chunk(upload_id, offset, chunk)
+            sent, chunks = sent + len(chunk), chunks + 1
+            if progress: progress(offset, size)
+        except Exception as e:
+            retries += 1
+            if retries > UPLOAD_MAX_RETRIES or not _upload_retryable(e):
+                _upload_stats().record(path, size, sent, time.time() - started, chunks, retries, False)
+                raise
+            time.sleep(0.5 * 2 ** min(retries, 4))
+            offset = None
+    pending.pop(key, None)
+    _upload_stats().record(path, size, sent, time.time() - started, chunks, retries, True)
+    return path
+
+def upload_document_to_supabase(file, progress=None):
     try:
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         ext = os.path.splitext(file.name)[1]
-        safe_file_name = f"doc_{timestamp}{ext}"
-        bucket_name = "club_documents"
-        file_bytes = file.getvalue()
-        supabase.storage.from_(bucket_name).upload(safe_file_name, file_bytes, {"content-type": file.type, "upsert": "true"})
-        res = supabase.storage.from_(bucket_name).get_public_url(safe_file_name)
-        if isinstance(res, str): return res
-        return getattr(res, 'public_url', str(res))
+        path = resumable_upload(DOCUMENT_BUCKET, f"doc_{timestamp}{ext}", file, {"content-type": file.type, "upsert": "true"}, progress)
+        return _public_url(DOCUMENT_BUCKET, path)
     except Exception as e:
-        st.error(f"ファイルアップロードエラー: {e}")
+        st.error(f"ファイルアップロードエラー（同じファイルを選び直すと続きから送信します）: {e}")
         return None
 
 def show_player_image(image_val, width=120):
     if not image_val:
         st.write("No Image")
         return
-    if str(image_val).startswith("http"): st.image(image_val, width=width)
+    thumb = thumbnail_url(image_val)
+    if str(image_val).startswith("http"): st.image(thumb, width=width)
+    elif os.path.exists(thumb): st.image(thumb, width=width)
     elif os.path.exists(str(image_val)): st.image(image_val, width=width)
     else: st.write("No Image")
 
@@ -135,7 +1135,6 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 COLOR_MAP = {"睡眠の質": "#1f77b4", "疲労度": "#d62728"}
-PHYS_TESTS = ["30mスプリント (秒)", "プロアジリティ (秒)", "垂直跳び (cm)", "Yo-Yoテスト (m)"]
 REHAB_PHASES = ["初期治療 (RICE等)", "患部外トレーニング", "ジョグ・基礎フィジカル", "部分合流 (対人なし)", "完全合流 (対人あり)"]
 
 if "authenticated" not in st.session_state: st.session_state.authenticated = False
@@ -202,19 +1201,22 @@ with lo_col2:
 st.divider()
 
 # データ取得
-df_players = fetch_table_as_df("players")
-df_cond = fetch_table_as_df("conditions")
-df_phys = fetch_table_as_df("physical_tests")
-df_tactics = fetch_table_as_df("tactics_board") 
-df_injury = fetch_table_as_df("injury_reports") 
-df_rehab = fetch_table_as_df("rehab_plans")     
+# 直前に送信した書き込みがあれば、反映を少しだけ待ってから読む。失敗した書き込みはここで知らせる
+if st.session_state.get("just_submitted", False): _write_queue().wait(st.session_state.user_name)
+for f_table, f_row, f_error in _write_queue().pop_failures(st.session_state.user_name):
+    st.error(f"❌ 保存に失敗しました ({f_table}): {f_error}")
+# スタッフの画面を開いたら変更フィードを起動する（プロセスで 1 つ。以後は全セッションのキャッシュがこれで更新される）
+if st.session_state.user_role in ("admin", "trainer"): _change_feed()
+lazy = LazyTables(plan_queries(st.session_state.user_role, st.session_state.user_name))
 
 # ========== トレーナーモード ==========
 if st.session_state.user_role == "trainer":
     # 【改修】トレーナーに「コンディション分析」タブを追加
-    tabs = st.tabs(["🏥 故障者登録", "📋 週次リハビリ計画提出", "✅ 復帰・状況管理", "📈 コンディション分析"])
+    TRAINER_TABS = ["🏥 故障者登録", "📋 週次リハビリ計画提出", "✅ 復帰・状況管理", "📈 コンディション分析"]
+    tab = select_tab(TRAINER_TABS, "trainer_tab")
     
-    with tabs[0]:
+    if tab == TRAINER_TABS[0]:
+        df_players = lazy.get("players")
         st.subheader("🏥 新規故障者の登録")
         with st.form("new_injury_form", clear_on_submit=True):
             if not df_players.empty:
@@ -229,6 +1231,7 @@ if st.session_state.user_role == "trainer":
                         try:
                             data = {"player_name": i_player, "injury_name": i_name, "injured_date": str(i_date), "target_return_date": str(i_target), "current_phase": i_phase, "is_active": True}
                             supabase.table("injury_reports").insert(data).execute()
+                            invalidate_table("injury_reports")
                             st.success(f"✅ {i_player}選手を故障者リストに登録しました！")
                             time.sleep(1.5)
                             st.rerun()
@@ -236,7 +1239,8 @@ if st.session_state.user_role == "trainer":
                             st.error(f"❌ 登録エラー: {e}")
                     else: st.error("❌ 診断名を入力してください。")
 
-    with tabs[1]:
+    if tab == TRAINER_TABS[1]:
+        df_injury = lazy.get("injury_reports")
         st.subheader("📋 監督への「週次リハビリ計画」提出")
         st.info("※ここで提出したメニューは、監督(Admin)が「承認」するまで選手には表示されません。")
         if not df_injury.empty:
@@ -257,15 +1261,23 @@ if st.session_state.user_role == "trainer":
                             try:
                                 data = {"injury_id": target_injury_id, "target_week_start": str(r_week), "menu_description": r_menu, "trainer_comment": r_comment, "is_approved": False}
                                 supabase.table("rehab_plans").insert(data).execute()
+                                invalidate_table("rehab_plans")
                                 st.success("✅ 監督へ「週次リハビリ計画」の提出が完了しました！")
                                 time.sleep(1.5)
                                 st.rerun()
                             except Exception as e:
                                 st.error(f"❌ 提出に失敗しました: {e}")
                         else: st.error("❌ メニュー詳細を入力してください。")
+                df_view = rehab_view(lazy)
+                if not df_view.empty:
+                    st.markdown("#### 提出済みの計画")
+                    latest = df_view.drop_duplicates("injury_id")
+                    st.dataframe(pd.DataFrame({"選手": latest["player_name"], "怪我": latest["injury_name"], "対象週": latest["target_week_start"],
+                                               "状態": np.where(latest["is_approved"] == True, "✅ 承認済", "⏳ 承認待ち")}), hide_index=True, use_container_width=True)
             else: st.write("現在、故障者リストに登録されている選手はいません。")
 
-    with tabs[2]:
+    if tab == TRAINER_TABS[2]:
+        df_injury = lazy.get("injury_reports")
         st.subheader("✅ 現在の故障者リストとフェーズ更新")
         if not df_injury.empty:
             active_injuries = df_injury[df_injury["is_active"] == True]
@@ -278,6 +1290,7 @@ if st.session_state.user_role == "trainer":
                         if st.button("フェーズを更新", key=f"btn_phase_{row['id']}"):
                             try:
                                 supabase.table("injury_reports").update({"current_phase": new_phase}).eq("id", row['id']).execute()
+                                invalidate_table("injury_reports", full=True)
                                 st.success("✅ 更新完了")
                                 time.sleep(1.0)
                                 st.rerun()
@@ -287,6 +1300,7 @@ if st.session_state.user_role == "trainer":
                         if st.button("🎉 復帰完了", key=f"btn_clear_{row['id']}", type="primary"):
                             try:
                                 supabase.table("injury_reports").update({"is_active": False}).eq("id", row['id']).execute()
+                                invalidate_table("injury_reports", full=True)
                                 st.success("🎉 復帰完了！")
                                 time.sleep(1.5)
                                 st.rerun()
@@ -294,16 +1308,32 @@ if st.session_state.user_role == "trainer":
                                 st.error(f"❌ エラー: {e}")
                                 
     # 【新規追加】トレーナー向けコンディション分析タブ
-    with tabs[3]:
+    if tab == TRAINER_TABS[3]:
+        df_players, df_cond = lazy.get("players", "conditions")
         st.subheader("⚠️ 要注意選手アラート (前日比)")
         st.info("💡 トレーナーの視点で、疲労の急増や睡眠不足の選手をいち早くキャッチし、ケアの判断に役立ててください。")
+        st.caption(f"※直近{TRAINER_COND_DAYS}日分の記録を表示しています。")
+        with st.expander("⚙️ アラート条件"):
+            a1, a2, a3 = st.columns(3)
+            with a1: fat_jump = st.number_input("疲労の前回比 (以上)", 1, 4, ALERT_THRESHOLDS["fatigue_jump"])
+            with a2: slp_drop = st.number_input("睡眠の前回比 (以上)", 1, 4, ALERT_THRESHOLDS["sleep_drop"])
+            with a3: w_drop = st.number_input("体重の減少 (kg以上)", 0.5, 5.0, ALERT_THRESHOLDS["weight_drop"], step=0.5)
+            a4, a5 = st.columns(2)
+            with a4: trend_n = st.number_input("連続傾向の回数", 2, 7, ALERT_THRESHOLDS["trend_entries"])
+            with a5: low_slp = st.number_input("睡眠不足とみなすスコア (以下)", 1, 4, ALERT_THRESHOLDS["low_sleep"])
         if not df_cond.empty and "player_name" in df_cond.columns:
-            for p in df_cond["player_name"].unique():
-                d = df_cond[df_cond["player_name"] == p].sort_values("date")
-                if len(d) >= 2:
-                    c, pr = d.iloc[-1], d.iloc[-2]
-                    r = [k for k, v in {"疲労急増": c["fatigue"]-pr["fatigue"]>=3, "睡眠悪化": pr["sleep"]-c["sleep"]>=3, "体重急減": pr["weight"]-c["weight"]>=1.5}.items() if v]
-                    if r: st.error(f"**{p}**: {', '.join(r)}")
+            show_live_alerts(lazy.plan["conditions"], {"fatigue_jump": fat_jump, "sleep_drop": slp_drop, "weight_drop": w_drop, "trend_entries": trend_n, "low_sleep": low_slp})
+            st.divider()
+
+            st.subheader("📊 負荷指標 (急性:慢性比)")
+            st.caption(f"※疲労度の EWMA ({WORKLOAD_ACUTE_DAYS}日 / {WORKLOAD_CHRONIC_DAYS}日) の比です。1.5 以上は負荷の急増の目安です。")
+            workload = _workload_metrics()
+            workload.sync(df_cond)
+            df_load = workload.latest()
+            if not df_load.empty:
+                df_load = df_load.sort_values("acwr", ascending=False)[["player_name", "date", f"fatigue_{WORKLOAD_ACUTE_DAYS}d", f"fatigue_{WORKLOAD_CHRONIC_DAYS}d", f"sleep_{WORKLOAD_ACUTE_DAYS}d", "acwr"]]
+                df_load["date"] = df_load["date"].dt.date
+                st.dataframe(df_load.rename(columns={"player_name": "選手", "date": "最終入力日", f"fatigue_{WORKLOAD_ACUTE_DAYS}d": f"疲労 {WORKLOAD_ACUTE_DAYS}日平均", f"fatigue_{WORKLOAD_CHRONIC_DAYS}d": f"疲労 {WORKLOAD_CHRONIC_DAYS}日平均", f"sleep_{WORKLOAD_ACUTE_DAYS}d": f"睡眠 {WORKLOAD_ACUTE_DAYS}日平均", "acwr": "ACWR"}).round(2), hide_index=True, use_container_width=True)
             st.divider()
             
             st.subheader("👤 選手個別のコンディション推移")
@@ -311,59 +1341,92 @@ if st.session_state.user_role == "trainer":
                 target = st.selectbox("分析する選手を選択", df_players["name"].tolist(), key="trainer_cond_target")
                 p_cond = df_cond[df_cond["player_name"] == target].sort_values("date")
                 if not p_cond.empty:
-                    st.plotly_chart(px.line(p_cond.rename(columns={"fatigue":"疲労度","sleep":"睡眠の質","weight":"体重"}), x="date", y=["疲労度","睡眠の質"], markers=True, range_y=[0,6], color_discrete_map=COLOR_MAP), use_container_width=True)
-                    st.plotly_chart(px.line(p_cond.rename(columns={"weight":"体重"}), x="date", y="体重", markers=True), use_container_width=True)
+                    show_condition_charts(target, p_cond)
+                    trend_chart("conditions", (target, "acwr"), workload.player_history(target), "acwr", title="ACWR の推移")
                 else:
                     st.write("この選手の記録はまだありません。")
 
 # ========== 管理者モード ==========
 elif st.session_state.user_role == "admin":
-    tabs = st.tabs(["📋 名簿・編集", "👤 新規登録", "📈 分析", "💊 代行入力", "🏆 ランキング", "⏱️ テスト入力", "🎬 戦術 / 📄 資料", "🏥 リハビリ承認"])
+    ADMIN_TABS = ["📋 名簿・編集", "👤 新規登録", "📈 分析", "💊 代行入力", "🏆 ランキング", "⏱️ テスト入力", "🎬 戦術 / 📄 資料", "🏥 リハビリ承認"]
+    tab = select_tab(ADMIN_TABS, "admin_tab")
 
-    with tabs[0]:
+    if tab == ADMIN_TABS[0]:
+        df_players = lazy.get("players")
         st.subheader("選手情報の編集・更新")
         if not df_players.empty:
-            for i, row in df_players.iterrows():
+            with st.expander("🖼️ 写真の軽量化"):
+                st.caption("以前に登録した写真（元画像のまま保存されたもの）を縮小し、一覧用のサムネイルを作ります。")
+                if st.button("既存の写真を変換する"):
+                    try:
+                        st.success(f"✅ {migrate_player_images(df_players)} 人分の写真を変換しました")
+                    except Exception as e:
+                        st.error(f"変換に失敗しました: {e}")
+            c_q, c_pos = st.columns([3, 2])
+            with c_q: q = st.text_input("🔍 検索（名前・背番号・ポジション）", key="roster_q")
+            with c_pos: q_pos = st.multiselect("ポジション", ["GK", "DF", "MF", "FW"], key="roster_pos")
+            hits = search_roster(df_players, q, q_pos)
+            n_pages = max(1, -(-len(hits) // ROSTER_PAGE_SIZE))
+            page = st.number_input(f"ページ (全 {n_pages})", 1, n_pages, 1, key=f"roster_page_{n_pages}") if n_pages > 1 else 1
+            view = hits.iloc[(page - 1) * ROSTER_PAGE_SIZE: page * ROSTER_PAGE_SIZE]
+            st.caption(f"{len(hits)} 人中 {min(len(hits), (page - 1) * ROSTER_PAGE_SIZE + 1)}〜{(page - 1) * ROSTER_PAGE_SIZE + len(view)} 人目")
+            table = view[["number", "name", "position", "height", "weight"]].copy()
+            table.insert(0, "写真", [thumbnail_url(v) if str(v or "").startswith("http") else None for v in view.get("image_url", pd.Series(None, index=view.index))])
+            # 選択は行の位置で残るので、検索条件・ページ・データが変わったら key を変えて選択を外す（別の選手の編集・削除にならないように）
+            view_key = hashlib.md5(repr((q, q_pos, page, data_version("players"))).encode()).hexdigest()[:12]
+            event = st.dataframe(table, hide_index=True, use_container_width=True, on_select="rerun", selection_mode="single-row", key=f"roster_table_{view_key}",
+                                 column_config={"写真": st.column_config.ImageColumn("写真", width="small"), "number": "背番号", "name": "名前", "position": "Pos", "height": "身長", "weight": "体重"})
+            sel = [i for i in event.selection.rows if i < len(view)]
+            if not sel:
+                st.info("編集する選手を一覧から選択してください。")
+            else:
+                # 編集用のウィジェットは選択中の 1 人分だけ作る
+                row = view.iloc[sel[0]]
                 bmi = calculate_bmi(row['height'], row['weight'])
-                with st.expander(f"No.{row['number']} : {row['name']} (Pos: {row['position']})"):
-                    with st.form(key=f"edit_form_{row['id']}"):
-                        c1, c2 = st.columns([1, 3])
-                        with c1:
-                            show_player_image(row.get('image_url'))
-                            e_img = st.file_uploader("写真を更新", type=["jpg", "png", "jpeg"], key=f"img_up_{row['id']}")
-                        with c2:
-                            e_name = st.text_input("名前", value=row['name'], key=f"name_edit_{row['id']}")
-                            e_num = st.number_input("背番号", value=int(row['number']), step=1)
-                            e_pos = st.selectbox("ポジション", ["GK", "DF", "MF", "FW"], index=["GK", "DF", "MF", "FW"].index(row['position']))
-                            e_height = st.number_input("身長 (cm)", value=float(row['height']), min_value=100.0, max_value=250.0, step=0.1)
-                            e_weight = st.number_input("体重 (kg)", value=float(row['weight']), min_value=30.0, max_value=150.0, step=0.1)
-                            
-                            st.markdown("---")
-                            col_pw1, col_pw2 = st.columns(2)
-                            with col_pw1: e_new_pw = st.text_input("選手の新パスワード", type="password", help="変更する場合のみ入力", key=f"pw_edit_{row['id']}")
-                            with col_pw2: e_new_parent_pw = st.text_input("保護者の新パスワード", type="password", help="変更する場合のみ入力", key=f"parent_pw_edit_{row['id']}")
-                            st.caption(f"現在のBMI: {bmi}")
-
-                        if st.form_submit_button("情報を更新"):
-                            try:
-                                update_data = {"name": e_name, "number": e_num, "position": e_pos, "height": e_height, "weight": e_weight}
-                                if e_new_pw: update_data["password_hash"] = hash_password(e_new_pw)
-                                if e_new_parent_pw: update_data["parent_password_hash"] = hash_password(e_new_parent_pw)
-                                if e_img:
-                                    url = upload_image_to_supabase(e_img, prefix=f"player_{e_num}")
-                                    if url: update_data["image_url"] = url
-                                    else: st.stop()
-                                supabase.table("players").update(update_data).eq("id", row['id']).execute()
-                                st.success(f"✅ {e_name} 選手の情報を更新しました！")
+                st.markdown(f"#### No.{row['number']} : {row['name']} (Pos: {row['position']})")
+                with st.form(key=f"edit_form_{row['id']}"):
+                    c1, c2 = st.columns([1, 3])
+                    with c1:
+                        show_player_image(row.get('image_url'))
+                        e_img = st.file_uploader("写真を更新", type=["jpg", "png", "jpeg"], key=f"img_up_{row['id']}")
+                    with c2:
+                        e_name = st.text_input("名前", value=row['name'], key=f"name_edit_{row['id']}")
+                        e_num = st.number_input("背番号", value=int(row['number']), step=1, key=f"num_edit_{row['id']}")
+                        e_pos = st.selectbox("ポジション", ["GK", "DF", "MF", "FW"], index=["GK", "DF", "MF", "FW"].index(row['position']), key=f"pos_edit_{row['id']}")
+                        e_height = st.number_input("身長 (cm)", value=float(row['height']), min_value=100.0, max_value=250.0, step=0.1, key=f"h_edit_{row['id']}")
+                        e_weight = st.number_input("体重 (kg)", value=float(row['weight']), min_value=30.0, max_value=150.0, step=0.1, key=f"w_edit_{row['id']}")
+
+                        st.markdown("---")
+                        col_pw1, col_pw2 = st.columns(2)
+                        with col_pw1: e_new_pw = st.text_input("選手の新パスワード", type="password", help="変更する場合のみ入力", key=f"pw_edit_{row['id']}")
+                        with col_pw2: e_new_parent_pw = st.text_input("保護者の新パスワード", type="password", help="変更する場合のみ入力", key=f"parent_pw_edit_{row['id']}")
+                        st.caption(f"現在のBMI: {bmi}")
+
+                    if st.form_submit_button("情報を更新"):
+                        try:
+                            update_data = changed_fields(row, {"name": e_name, "number": e_num, "position": e_pos, "height": e_height, "weight": e_weight})
+                            if e_new_pw: update_data["password_hash"] = hash_password(e_new_pw)
+                            if e_new_parent_pw: update_data["parent_password_hash"] = hash_password(e_new_parent_pw)
+                            if e_img:
+                                url = upload_image_to_supabase(e_img, prefix=f"player_{e_num}")
+                                if url: update_data["image_url"] = url
+                                else: st.stop()
+                            if not update_data:
+                                st.info("変更はありません。")
+                            else:
+                                res = supabase.table("players").update(update_data).eq("id", row['id']).execute()
+                                _table_cache().patch("players", res.data)
+                                st.success(f"✅ {e_name} 選手の情報を更新しました！（{', '.join(update_data)}）")
                                 time.sleep(1.0)
                                 st.rerun()
-                            except Exception as e: st.error(f"更新エラー: {e}")
-                    with st.expander("🗑️ 削除メニュー（注意）"):
-                        if st.button("削除を確定する", key=f"del_btn_{row['id']}", type="primary"):
-                            supabase.table("players").delete().eq("id", row['id']).execute()
-                            st.rerun()
+                        except Exception as e: st.error(f"更新エラー: {e}")
+                with st.expander("🗑️ 削除メニュー（注意）"):
+                    if st.button("削除を確定する", key=f"del_btn_{row['id']}", type="primary"):
+                        supabase.table("players").delete().eq("id", row['id']).execute()
+                        invalidate_table("players", full=True)
+                        st.rerun()
 
-    with tabs[1]:
+    if tab == ADMIN_TABS[1]:
         st.subheader("👤 新規選手登録")
         with st.form("reg_player", clear_on_submit=True):
             n_name = st.text_input("名前")
@@ -387,41 +1450,76 @@ elif st.session_state.user_role == "admin":
                         "image_url": url
                     }
                     supabase.table("players").insert(data).execute()
+                    invalidate_table("players")
                     st.success(f"✅ {n_name} を新規登録しました！")
                     time.sleep(1.0)
                     st.rerun()
 
-    with tabs[2]:
+    if tab == ADMIN_TABS[2]:
+        df_players, df_cond, df_phys = lazy.get("players", "conditions", "physical_tests")
         st.subheader("⚠️ 要注意選手アラート (前日比)")
         if not df_cond.empty and "player_name" in df_cond.columns:
-            for p in df_cond["player_name"].unique():
-                d = df_cond[df_cond["player_name"] == p].sort_values("date")
-                if len(d) >= 2:
-                    c, pr = d.iloc[-1], d.iloc[-2]
-                    r = [k for k, v in {"疲労急増": c["fatigue"]-pr["fatigue"]>=3, "睡眠悪化": pr["sleep"]-c["sleep"]>=3, "体重急減": pr["weight"]-c["weight"]>=1.5}.items() if v]
-                    if r: st.error(f"**{p}**: {', '.join(r)}")
+            show_live_alerts(lazy.plan["conditions"])
             st.divider()
             st.subheader("📊 チーム平均推移")
-            df_avg = df_cond.groupby("date")[["fatigue", "sleep"]].mean().reset_index().rename(columns={"fatigue": "疲労度", "sleep": "睡眠の質"})
+            rollup = _daily_rollup()
+            rollup.sync(df_cond, df_players)
+            z1, z2 = st.columns(2)
+            with z1: zoom = st.radio("集計単位", list(ROLLUP_FREQS), horizontal=True, key="team_avg_zoom")
+            with z2: avg_pos = st.selectbox("ポジション", ["全体", "GK", "DF", "MF", "FW"], key="team_avg_pos")
+            df_avg = rollup.series(ROLLUP_FREQS[zoom], None if avg_pos == "全体" else avg_pos).rename(columns={"fatigue": "疲労度", "sleep": "睡眠の質"})
             st.plotly_chart(px.line(df_avg, x="date", y=["疲労度", "睡眠の質"], range_y=[0, 6], markers=True, color_discrete_map=COLOR_MAP), use_container_width=True)
             st.divider()
             
             st.subheader("👤 個人詳細分析")
             if not df_players.empty:
                 target = st.selectbox("分析する選手を選択", df_players["name"].tolist(), key="admin_target")
-                p_cond = df_cond[df_cond["player_name"] == target].sort_values("date")
+                p_cond = with_archive("conditions", df_cond[df_cond["player_name"] == target].sort_values("date"), [target])
                 if not p_cond.empty:
-                    st.plotly_chart(px.line(p_cond.rename(columns={"fatigue":"疲労度","sleep":"睡眠の質","weight":"体重"}), x="date", y=["疲労度","睡眠の質"], markers=True, range_y=[0,6], color_discrete_map=COLOR_MAP), use_container_width=True)
-                    st.plotly_chart(px.line(p_cond.rename(columns={"weight":"体重"}), x="date", y="体重", markers=True), use_container_width=True)
-                p_phys = df_phys[df_phys["player_name"] == target].sort_values("date") if not df_phys.empty and "player_name" in df_phys.columns else pd.DataFrame()
+                    show_condition_charts(target, p_cond)
+                    if p_cond["date"].map(season_of).nunique() > 1:
+                        st.markdown("#### シーズン比較 (月平均)")
+                        df_season = season_monthly(p_cond, ["fatigue", "sleep"]).rename(columns={"fatigue": "疲労度", "sleep": "睡眠の質"})
+                        st.plotly_chart(px.line(df_season, x="月", y="疲労度", color="シーズン", markers=True, range_y=[0, 6], hover_data=["睡眠の質"]), use_container_width=True)
+                p_phys = with_archive("physical_tests", df_phys[df_phys["player_name"] == target].sort_values("date"), [target]) if not df_phys.empty and "player_name" in df_phys.columns else pd.DataFrame()
                 if not p_phys.empty and "test_name" in p_phys.columns:
                     st.markdown("#### フィジカルテスト履歴")
                     t_kind = st.selectbox("種目を選択", PHYS_TESTS, key="admin_phys_kind")
                     p_test = p_phys[p_phys["test_name"] == t_kind]
-                    if not p_test.empty: st.plotly_chart(px.line(p_test, x="date", y="value", markers=True, title=f"{t_kind}の推移"), use_container_width=True)
+                    if not p_test.empty: trend_chart("physical_tests", (target, t_kind), p_test, "value", title=f"{t_kind}の推移")
                     else: st.write("この種目の記録はありません。")
 
-    with tabs[3]:
+        with st.expander("🔧 データ取得状況"):
+            st.caption(_connection_stats().summary())
+            st.caption(_change_feed().summary())
+            st.caption(_figure_cache().summary())
+            df_stats = _table_cache().stats_df()
+            if not df_stats.empty:
+                df_stats["KB"] = (df_stats.pop("bytes") / 1024).round(1)
+                st.dataframe(df_stats, hide_index=True, use_container_width=True)
+            df_uploads = _upload_stats().df()
+            if not df_uploads.empty:
+                st.caption("資料アップロード（直近 50 件）")
+                st.dataframe(df_uploads, hide_index=True, use_container_width=True)
+
+        with st.expander("🗄️ シーズンアーカイブ"):
+            st.caption("指定した月より前のコンディション・フィジカルテストを Parquet に書き出します。書き出した期間は個人詳細分析のグラフにも含まれます。")
+            for t in ARCHIVE_TABLES:
+                df_arc = archive_summary(t)
+                st.caption(f"{t}: {len(df_arc)} か月分 / {int(df_arc['rows'].sum()) if not df_arc.empty else 0} 行")
+            ac1, ac2 = st.columns(2)
+            with ac1: cutoff = st.date_input("この月より前を書き出す", archive_cutoff(), key="archive_cutoff")
+            with ac2: prune = st.checkbox("書き出した行をデータベースから削除する", key="archive_prune", help="各選手・各種目の最新のテスト記録は残します。")
+            if st.button("アーカイブを書き出す", key="archive_export"):
+                try:
+                    for t in ARCHIVE_TABLES:
+                        written, deleted = export_archive(t, cutoff, prune)
+                        st.success(f"✅ {t}: {written} 行を書き出し" + (f"、{deleted} 行を削除しました" if prune else "ました"))
+                except Exception as e:
+                    st.error(f"書き出しに失敗しました: {e}")
+
+    if tab == ADMIN_TABS[3]:
+        df_players = lazy.get("players")
         st.subheader("💊 コンディション記録代行")
         with st.container(border=True):
             if not df_players.empty:
@@ -434,10 +1532,21 @@ elif st.session_state.user_role == "admin":
                 with c2:
                     p_f, p_s = st.slider("疲労", 1, 5, 3), st.slider("睡眠", 1, 5, 3)
                 if st.button("代行保存", use_container_width=True):
-                    supabase.table("conditions").insert({"player_name": p_t, "date": str(date.today()), "weight": p_w, "fatigue": p_f, "sleep": p_s, "injury": p_i, "injury_detail": p_id}).execute()
-                    st.success("✅ 保存完了")
+                    enqueue_condition({"player_name": p_t, "date": str(date.today()), "weight": p_w, "fatigue": p_f, "sleep": p_s, "injury": p_i, "injury_detail": p_id})
+                    st.success("✅ 保存完了（同じ日の記録がある場合は上書き）")
+        with st.expander("📥 ファイルから一括取り込み"):
+            st.caption("同じ選手・同じ日付の記録がある場合は上書きされます。")
+            show_bulk_import("conditions", df_players["name"].tolist() if not df_players.empty else [], "cond_import")
+        with st.expander("🧹 重複記録の整理"):
+            st.caption("同じ選手・同じ日付のコンディションが複数ある場合、最新の 1 件だけを残して削除します。")
+            if st.button("重複を整理する"):
+                try:
+                    st.success(f"✅ {compact_conditions()} 件の重複を削除しました")
+                except Exception as e:
+                    st.error(f"整理に失敗しました: {e}")
 
-    with tabs[4]:
+    if tab == ADMIN_TABS[4]:
+        df_phys, df_cond = lazy.get("physical_tests", "conditions")
         st.subheader("🏆 フィジカルランキング")
         if not df_phys.empty and "test_name" in df_phys.columns:
             cols = st.columns(2)
@@ -448,25 +1557,58 @@ elif st.session_state.user_role == "admin":
                     if not sub.empty:
                         st.dataframe(sub.sort_values("value", ascending=("秒" in test)).drop_duplicates("player_name").head(5)[["player_name", "value", "date"]], hide_index=True)
 
-    with tabs[5]:
+            st.divider()
+            st.subheader("🕸️ フィジカル比較")
+            matrix = physical_score_matrix(df_phys)
+            compare = st.multiselect("比較する選手", sorted(matrix["player_name"].unique()), max_selections=5, key="phys_compare")
+            if compare:
+                fig = px.line_polar(matrix[matrix["player_name"].isin(compare)], r="スコア", theta="テスト", color="player_name", line_close=True, range_r=[0, 100])
+                st.plotly_chart(fig, use_container_width=True)
+                st.dataframe(matrix[matrix["player_name"].isin(compare)].pivot(index="player_name", columns="テスト", values="スコア"), use_container_width=True)
+
+        st.divider()
+        st.subheader("🔥 入力ストリーク")
+        st.caption("※火〜金の連続入力日数です。")
+        df_streaks = calculate_streaks(with_archive("conditions", df_cond))
+        if not df_streaks.empty:
+            board = df_streaks.sort_values(["current_streak", "longest_streak"], ascending=False).head(10)
+            st.dataframe(board.rename(columns={"player_name": "選手", "current_streak": "現在の連続日数", "longest_streak": "最長記録"}), hide_index=True, use_container_width=True)
+
+        st.divider()
+        with st.expander("📄 ポートフォリオの一括出力 (PDF)"):
+            st.caption("全選手のポートフォリオを 1 人 1 ファイルの PDF にし、ZIP にまとめてダウンロードします。")
+            if st.button("PDF を作成する", key="portfolio_build"):
+                items = portfolio_items(lazy.get("players"), df_cond, df_phys)
+                if items:
+                    bar = st.progress(0.0, text="作成中…")
+                    st.session_state["portfolio_zip"] = build_portfolio_zip(items, progress=lambda i, n: bar.progress(i / n, text=f"作成中… {i} / {n}"))
+                    bar.empty()
+                else:
+                    st.info("選手が登録されていません。")
+            if st.session_state.get("portfolio_zip"):
+                st.download_button("📥 ZIP をダウンロード", st.session_state["portfolio_zip"], file_name=f"portfolio_{date.today():%Y%m%d}.zip", mime="application/zip")
+
+    if tab == ADMIN_TABS[5]:
+        df_players = lazy.get("players")
         st.subheader("⏱️ フィジカルテスト記録入力")
-        with st.form("reg_phys", clear_on_submit=True):
-            if not df_players.empty:
-                t_p = st.selectbox("選手", df_players["name"].tolist())
-                t_n, t_v = st.selectbox("種目", PHYS_TESTS), st.number_input("数値", step=0.01)
-                t_d = st.date_input("測定日", date.today())
-                if st.form_submit_button("保存"):
-                    supabase.table("physical_tests").insert({"player_name": t_p, "test_name": t_n, "value": t_v, "date": str(t_d)}).execute()
-                    st.success("✅ 完了")
-                    time.sleep(1.0)
-                    st.rerun()
+        if st.radio("入力方法", ["1件ずつ", "ファイル一括"], horizontal=True, key="phys_mode") == "ファイル一括":
+            show_bulk_import("physical_tests", df_players["name"].tolist() if not df_players.empty else [], "phys_import")
+        else:
+            with st.form("reg_phys", clear_on_submit=True):
+                if not df_players.empty:
+                    t_p = st.selectbox("選手", df_players["name"].tolist())
+                    t_n, t_v = st.selectbox("種目", PHYS_TESTS), st.number_input("数値", step=0.01)
+                    t_d = st.date_input("測定日", date.today())
+                    if st.form_submit_button("保存"):
+                        enqueue_insert("physical_tests", {"player_name": t_p, "test_name": t_n, "value": t_v, "date": str(t_d)})
+                        st.success(f"✅ {t_p} / {t_n}: {t_v} を保存しました")
                     
-    with tabs[6]:
+    if tab == ADMIN_TABS[6]:
         st.subheader("🎬 戦術動画 / 📄 保護者向け資料 の共有")
         st.info("選手には「戦術」カテゴリーが、保護者には「保護者向け資料」カテゴリーだけが表示されます。")
         with st.form("tactics_form", clear_on_submit=True):
             t_title = st.text_input("タイトル (例: 栄養管理について / 対戦相手スカウティング)")
-            t_cat = st.selectbox("カテゴリー", ["自チームの戦術モデル", "対戦相手スカウティング", "保護者向け資料 (PDF/画像)", "その他（モチベーション等）"])
+            t_cat = st.selectbox("カテゴリー", TACTICS_CATEGORIES)
             t_desc = st.text_area("コーチからのコメント・解説")
             
             st.markdown("---")
@@ -483,7 +1625,8 @@ elif st.session_state.user_role == "admin":
                     media_link = ""
                     m_type = ""
                     if t_file:
-                        uploaded_url = upload_document_to_supabase(t_file)
+                        bar = st.progress(0.0, text="アップロード中...")
+                        uploaded_url = upload_document_to_supabase(t_file, lambda done, total: bar.progress(done / total, text=f"{done / 1e6:.1f} / {total / 1e6:.1f} MB"))
                         if uploaded_url:
                             media_link = uploaded_url
                             m_type = "document"
@@ -495,50 +1638,37 @@ elif st.session_state.user_role == "admin":
 
                     data = {"title": t_title, "category": t_cat, "description": t_desc, "media_url": media_link, "media_type": m_type}
                     supabase.table("tactics_board").insert(data).execute()
+                    invalidate_table("tactics_board")
                     st.success("✅ 共有が完了しました！")
                     time.sleep(1.0)
                     st.rerun()
         
         st.divider()
         st.subheader("🗑️ 共有済みのコンテンツ一覧")
-        if not df_tactics.empty:
-            for i, row in df_tactics.sort_values("id", ascending=False).iterrows():
-                with st.expander(f"[{row['category']}] {row['title']}"):
-                    st.write(row['description'])
-                    if row['media_type'] == "document":
-                        st.markdown(f"[📄 ダウンロード/閲覧する]({row['media_url']})")
-                    else:
-                        st.write(f"URL: {row['media_url']}")
-                        
-                    if st.button("この投稿を削除", key=f"del_tac_{row['id']}"):
-                        supabase.table("tactics_board").delete().eq("id", row['id']).execute()
-                        st.rerun()
-        else:
-            st.info("現在共有されているコンテンツはありません。")
+        show_tactics_feed("admin", "admin_tac", deletable=True)
 
-    with tabs[7]:
+    if tab == ADMIN_TABS[7]:
+        df_view = rehab_view(lazy)
         st.subheader("🏥 トレーナーからの「リハビリ計画」承認待ち一覧")
-        if not df_rehab.empty and not df_injury.empty:
-            pending_plans = df_rehab[df_rehab["is_approved"] == False]
+        if not df_view.empty:
+            pending_plans = df_view[df_view["is_approved"] == False]
             if not pending_plans.empty:
                 for i, plan in pending_plans.iterrows():
-                    inj_info = df_injury[df_injury["id"] == plan["injury_id"]]
-                    if not inj_info.empty:
-                        inj = inj_info.iloc[0]
-                        with st.expander(f"⚠️ 承認待ち: {inj['player_name']} - {inj['injury_name']} (対象週: {plan['target_week_start']})", expanded=True):
-                            st.write(f"**現在のフェーズ**: {inj['current_phase']} | **復帰目標**: {inj['target_return_date']}")
-                            st.markdown(f"**📝 トレーナーからの連絡**:\n{plan['trainer_comment']}")
-                            st.markdown(f"**🏃‍♂️ メニュー詳細**:\n{plan['menu_description']}")
-                            
-                            st.markdown("---")
-                            if st.button("✅ この計画を承認して選手に公開する", key=f"approve_{plan['id']}", type="primary"):
-                                try:
-                                    supabase.table("rehab_plans").update({"is_approved": True}).eq("id", plan['id']).execute()
-                                    st.success(f"✅ {inj['player_name']} 選手の計画を承認しました！選手・保護者の画面に反映されます。")
-                                    time.sleep(1.5)
-                                    st.rerun()
-                                except Exception as e:
-                                    st.error(f"❌ 承認エラー: {e}")
+                    with st.expander(f"⚠️ 承認待ち: {plan['player_name']} - {plan['injury_name']} (対象週: {plan['target_week_start']})", expanded=True):
+                        st.write(f"**現在のフェーズ**: {plan['current_phase']} | **復帰目標**: {plan['target_return_date']}")
+                        st.markdown(f"**📝 トレーナーからの連絡**:\n{plan['trainer_comment']}")
+                        st.markdown(f"**🏃‍♂️ メニュー詳細**:\n{plan['menu_description']}")
+                        
+                        st.markdown("---")
+                        if st.button("✅ この計画を承認して選手に公開する", key=f"approve_{plan['id']}", type="primary"):
+                            try:
+                                supabase.table("rehab_plans").update({"is_approved": True}).eq("id", plan['id']).execute()
+                                invalidate_table("rehab_plans", full=True)
+                                st.success(f"✅ {plan['player_name']} 選手の計画を承認しました！選手・保護者の画面に反映されます。")
+                                time.sleep(1.5)
+                                st.rerun()
+                            except Exception as e:
+                                st.error(f"❌ 承認エラー: {e}")
             else:
                 st.info("現在、トレーナーから上がってきている承認待ちの計画はありません。")
         else:
@@ -551,9 +1681,14 @@ else:
         st.balloons()
         st.session_state["just_submitted"] = False
 
-    my_info = df_players[df_players["name"] == st.session_state.user_name].iloc[0]
+    df_players, df_cond, df_injury = lazy.get("players", "conditions", "injury_reports")
+    my_rows = df_players[df_players["name"] == st.session_state.user_name] if not df_players.empty else pd.DataFrame()
+    if my_rows.empty:
+        st.warning("選手情報を読み込めませんでした。しばらくしてから再読み込みしてください。")
+        st.stop()
+    my_info = my_rows.iloc[0]
     img_val = my_info.get("image_url")
-    img_src = img_val if (img_val and str(img_val).startswith("http")) else "https://via.placeholder.com/150"
+    img_src = thumbnail_url(img_val) if (img_val and str(img_val).startswith("http")) else "https://via.placeholder.com/150"
     bmi_val = calculate_bmi(my_info['height'], my_info['weight'])
     streak_count = calculate_streak(st.session_state.user_name, df_cond)
     streak_color = "#ff4b4b" if streak_count >= 3 else "#ff9900" if streak_count > 0 else "gray"
@@ -575,8 +1710,9 @@ else:
             </div>
             """, unsafe_allow_html=True)
             
-            if not df_rehab.empty:
-                my_plans = df_rehab[(df_rehab["injury_id"] == current_inj["id"]) & (df_rehab["is_approved"] == True)].sort_values("target_week_start", ascending=False)
+            df_view = rehab_view(lazy)
+            if not df_view.empty:
+                my_plans = df_view[(df_view["injury_id"] == current_inj["id"]) & (df_view["is_approved"] == True)]
                 if not my_plans.empty:
                     latest_plan = my_plans.iloc[0]
                     with st.expander(f"✅ 今週のメニュー (対象週: {latest_plan['target_week_start']} ~) ※監督承認済", expanded=True):
@@ -598,17 +1734,19 @@ else:
     my_cond = pd.DataFrame()
     if not df_cond.empty and "player_name" in df_cond.columns:
         my_cond = df_cond[df_cond["player_name"] == st.session_state.user_name].sort_values("date")
+    # アーカイブへ移した過去シーズン分も履歴とポートフォリオに含める
+    my_cond = with_archive("conditions", my_cond, [st.session_state.user_name])
         
     if st.session_state.user_role == "player":
-        tabs_player = st.tabs(["📝 入力", "📊 履歴", "🔥 パラメーター", "🔐 PW", "🎬 戦術ボード", "🎓 ポートフォリオ"])
-        tab_in, tab_hist, tab_param, tab_pw, tab_tac, tab_port = tabs_player[0], tabs_player[1], tabs_player[2], tabs_player[3], tabs_player[4], tabs_player[5]
+        PLAYER_TABS = {"📝 入力": "in", "📊 履歴": "hist", "🔥 パラメーター": "param", "🔐 PW": "pw", "🎬 戦術ボード": "tac", "🎓 ポートフォリオ": "port"}
     else:
         st.info("💡 保護者モードではデータの閲覧のみ可能です。毎日のコンディション入力は選手本人の画面から行われます。")
-        tabs_parent = st.tabs(["📊 コンディション履歴", "🔥 パラメーター", "📄 お便り・資料", "🎓 ポートフォリオ", "🔐 PW"])
-        tab_hist, tab_param, tab_tac, tab_port, tab_pw = tabs_parent[0], tabs_parent[1], tabs_parent[2], tabs_parent[3], tabs_parent[4]
+        PLAYER_TABS = {"📊 コンディション履歴": "hist", "🔥 パラメーター": "param", "📄 お便り・資料": "tac", "🎓 ポートフォリオ": "port", "🔐 PW": "pw"}
+    tab = PLAYER_TABS[select_tab(list(PLAYER_TABS), f"{st.session_state.user_role}_tab")]
+    radar_key = ("radar", st.session_state.user_name)
 
     if st.session_state.user_role == "player":
-        with tab_in:
+        if tab == "in":
             with st.container(border=True):
                 c1, c2 = st.columns(2)
                 with c1:
@@ -625,22 +1763,16 @@ else:
                         "weight": in_w, "fatigue": in_fat, "sleep": in_slp, 
                         "injury": in_inj, "injury_detail": in_inj_dt
                     }
-                    supabase.table("conditions").insert(data).execute()
+                    enqueue_condition(data)
                     st.session_state["just_submitted"] = True
                     st.rerun()
 
-    with tab_hist:
+    if tab == "hist":
         if not my_cond.empty:
-            if len(my_cond) >= 2:
-                curr, prev = my_cond.iloc[-1], my_cond.iloc[-2]
-                reasons = [k for k, v in {"疲労急増": curr["fatigue"]-prev["fatigue"]>=3, "睡眠悪化": prev["sleep"]-curr["sleep"]>=3, "体重急減": prev["weight"]-curr["weight"]>=1.5}.items() if v]
-                if reasons: st.error(f"⚠️ **要注意アラート**: {', '.join(reasons)}。無理をせずコーチやスタッフに相談してください。")
-            
-            st.markdown("#### コンディション推移")
-            st.plotly_chart(px.line(my_cond.rename(columns={"fatigue": "疲労度", "sleep": "睡眠の質", "weight": "体重"}), x="date", y=["疲労度", "睡眠の質"], range_y=[0,6], markers=True, color_discrete_map=COLOR_MAP), use_container_width=True)
+            my_alerts = detect_condition_alerts(my_cond)
+            if not my_alerts.empty: st.error(f"⚠️ **要注意アラート**: {my_alerts.iloc[0]['理由']}。無理をせずコーチやスタッフに相談してください。")
             
-            st.markdown("#### 体重推移")
-            st.plotly_chart(px.line(my_cond.rename(columns={"weight": "体重"}), x="date", y="体重", markers=True), use_container_width=True)
+            show_condition_charts(st.session_state.user_name, my_cond, headings=True)
             
             last_w = my_cond.iloc[-1]["weight"]
             prev_w = my_cond.iloc[-2]["weight"] if len(my_cond) >= 2 else my_info['weight']
@@ -658,8 +1790,8 @@ else:
             if progress_val >= 1.0: st.success("🎉 目標体重クリア！素晴らしいフィジカルです！")
         else: st.info("データがまだありません。")
 
-    df_radar = calculate_physical_score(st.session_state.user_name, df_phys)
-    with tab_param:
+    if tab == "param":
+        df_radar = lazy.memo(radar_key, lambda: calculate_physical_score(st.session_state.user_name, lazy.get("physical_tests")))
         st.subheader("🔥 身体能力パラメーター")
         st.caption("※チーム内の成績をもとにした相対評価（0〜100）です。")
         if not df_radar.empty and len(df_radar) >= 3:
@@ -673,7 +1805,7 @@ else:
             st.dataframe(df_radar[["テスト", "実数値", "単位"]], hide_index=True)
         else: st.info("まだフィジカルテストの記録がありません。測定日をお楽しみに！")
 
-    with tab_pw:
+    if tab == "pw":
         with st.form("pw_form"):
             curr_pw, new_pw = st.text_input("現在のパスワード", type="password"), st.text_input("新しいパスワード", type="password")
             if st.form_submit_button("更新"):
@@ -681,35 +1813,17 @@ else:
                 pw_column = "parent_password_hash" if st.session_state.user_role == "parent" else "password_hash"
                 if hash_password(curr_pw) == my_info[pw_column] and len(new_pw) >= 4:
                     supabase.table("players").update({pw_column: hash_password(new_pw)}).eq("id", my_info['id']).execute()
+                    invalidate_table("players", full=True)
                     st.success("完了！")
                 else: st.error("現在のパスワードが間違っているか、新しいパスワードが短すぎます。")
                         
-    with tab_tac:
-        if not df_tactics.empty:
-            if st.session_state.user_role == "player":
-                st.subheader("🎬 戦術＆スカウティングボード")
-                display_data = df_tactics[df_tactics["category"] != "保護者向け資料 (PDF/画像)"]
-            else:
-                st.subheader("📄 クラブからの栄養・広報だより")
-                display_data = df_tactics[df_tactics["category"] == "保護者向け資料 (PDF/画像)"]
-
-            if not display_data.empty:
-                for i, row in display_data.sort_values("id", ascending=False).iterrows():
-                    with st.expander(f"[{row['category']}] {row['title']}", expanded=True):
-                        if row['description']:
-                            st.markdown(f"**📝 コメント:**\n\n{row['description']}")
-                            st.markdown("<br>", unsafe_allow_html=True)
-                        if row['media_type'] == "document":
-                            st.markdown(f"<a href='{row['media_url']}' target='_blank' class='doc-link-btn'>📄 {row['title']} を開く</a>", unsafe_allow_html=True)
-                        elif "youtube.com" in row['media_url'] or "youtu.be" in row['media_url']:
-                            st.video(row['media_url'])
-                        else: st.write(row['media_url'])
-            else:
-                if st.session_state.user_role == "player": st.info("現在共有されている戦術映像はありません。")
-                else: st.info("現在共有されている資料はありません。")
-        else: st.info("現在共有されているコンテンツはありません。")
+    if tab == "tac":
+        if st.session_state.user_role == "player": st.subheader("🎬 戦術＆スカウティングボード")
+        else: st.subheader("📄 クラブからの栄養・広報だより")
+        show_tactics_feed(st.session_state.user_role, "tac")
 
-    with tab_port:
+    if tab == "port":
+        df_radar = lazy.memo(radar_key, lambda: calculate_physical_score(st.session_state.user_name, lazy.get("physical_tests")))
         st.info("💡 スマートフォンやPCのブラウザ機能から「印刷」→「PDFとして保存」を選択すると、進路活動などの提出用資料として美しく出力できます。")
         st.markdown(f"""
         <div class="portfolio-box">
@@ -0,0 +1,131 @@
+import io
+import os
+import math
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.lib.units import mm
+
+# 選手ポートフォリオの PDF 生成。Streamlit に依存しないので、プロセスプールのワーカーからそのまま import できる。
+# 入力は players.py 側で全選手分をまとめて計算した値（1 人 1 つの dict）
+FONT_NAME = 'HeiseiKakuGo-W5'
+MAIN_COLOR = (1 / 255, 87 / 255, 155 / 255)
+# 1 ページ約 4ms に対し spawn でのワーカー起動は約 0.3 秒かかるので、これより少ない人数は同じプロセスで作る
+POOL_MIN_ITEMS = 80
+
+def _register_font():
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(UnicodeCIDFont(FONT_NAME))
+
+def _fmt_value(r):
+    # 実数値は小数 2 桁まで、単位は "(秒)" の括弧を外して "11.4秒" のようにする
+    return f"{round(r['value'], 2):g}{r['unit'].strip('()')}"
+
+def _draw_radar(p, cx, cy, radius, radar):
+    n = len(radar)
+    angles = [math.pi / 2 - 2 * math.pi * i / n for i in range(n)]
+    point = lambda a, r: (cx + r * math.cos(a), cy + r * math.sin(a))
+
+    # 目盛り (25 / 50 / 75 / 100) と軸
+    p.setStrokeColorRGB(0.8, 0.8, 0.8)
+    p.setLineWidth(0.5)
+    for level in (0.25, 0.5, 0.75, 1.0):
+        pts = [point(a, radius * level) for a in angles]
+        p.lines([(*pts[i], *pts[(i + 1) % n]) for i in range(n)])
+    for a in angles:
+        p.line(cx, cy, *point(a, radius))
+
+    # スコアの多角形
+    path = p.beginPath()
+    for i, (a, item) in enumerate(zip(angles, radar)):
+        x, y = point(a, radius * max(0, min(100, item["score"])) / 100)
+        if i == 0: path.moveTo(x, y)
+        else: path.lineTo(x, y)
+    path.close()
+    p.setStrokeColorRGB(*MAIN_COLOR)
+    p.setFillColorRGB(*MAIN_COLOR)
+    p.setFillAlpha(0.3)
+    p.setLineWidth(1.5)
+    p.drawPath(path, stroke=1, fill=1)
+    p.setFillAlpha(1)
+
+    p.setFillColorRGB(0, 0, 0)
+    p.setFont(FONT_NAME, 9)
+    for a, item in zip(angles, radar):
+        x, y = point(a, radius + 8 * mm)
+        p.drawCentredString(x, y - 1.5 * mm, item["test"])
+        p.drawCentredString(x, y - 5.5 * mm, f"{item['score']:.0f} 点 ({_fmt_value(item)})")
+
+def render_portfolio(item):
+    """1 人分のポートフォリオを PDF にして (ファイル名, バイト列) を返す"""
+    _register_font()
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    p.setTitle(f"{item['name']} ポートフォリオ")
+
+    p.setFillColorRGB(*MAIN_COLOR)
+    p.setFont(FONT_NAME, 20)
+    p.drawCentredString(105 * mm, 275 * mm, "Tough & Elegant")
+    p.setFont(FONT_NAME, 16)
+    p.drawCentredString(105 * mm, 265 * mm, "アスリート成長ポートフォリオ")
+    p.setStrokeColorRGB(*MAIN_COLOR)
+    p.line(20 * mm, 258 * mm, 190 * mm, 258 * mm)
+    p.setFillColorRGB(0, 0, 0)
+
+    p.setFont(FONT_NAME, 14)
+    p.drawString(20 * mm, 245 * mm, "【基本情報】")
+    p.setFont(FONT_NAME, 11)
+    p.drawString(25 * mm, 235 * mm, f"氏名: {item['name']} (背番号: {item['number']})")
+    p.drawString(25 * mm, 227 * mm, f"ポジション: {item['position']}")
+    p.drawString(25 * mm, 219 * mm, f"現在の体格: 身長 {item['height']}cm / 体重 {item['weight']}kg (BMI: {item['bmi']})")
+
+    p.setFont(FONT_NAME, 14)
+    p.drawString(20 * mm, 203 * mm, "【自己管理力 (Self-Management)】")
+    p.setFont(FONT_NAME, 11)
+    p.drawString(25 * mm, 193 * mm, f"総入力日数: {item['total_inputs']} 日")
+    p.drawString(25 * mm, 185 * mm, f"連続入力（ストリーク）: 現在 {item['streak']} 日 / 最長 {item['longest_streak']} 日")
+    p.drawString(25 * mm, 177 * mm, f"平均睡眠スコア: {item['avg_sleep']} / 5.0    平均疲労スコア: {item['avg_fatigue']} / 5.0")
+
+    p.setFont(FONT_NAME, 14)
+    p.drawString(20 * mm, 161 * mm, "【身体能力 (Physical Performance)】")
+    radar = item.get("radar") or []
+    p.setFont(FONT_NAME, 11)
+    if len(radar) >= 3:
+        _draw_radar(p, 105 * mm, 95 * mm, 45 * mm, radar)
+    elif radar:
+        for i, r in enumerate(radar):
+            p.drawString(25 * mm, (151 - 8 * i) * mm, f"{r['test']}: {_fmt_value(r)} ({r['score']:.0f} 点)")
+    else:
+        p.drawString(25 * mm, 151 * mm, "※データ計測待ち")
+
+    p.setFont(FONT_NAME, 8)
+    p.setFillColorRGB(0.4, 0.4, 0.4)
+    p.drawString(20 * mm, 15 * mm, f"出力日: {item['generated']}  ※スコアはクラブ内での相対評価 (0〜100) です。")
+
+    p.showPage()
+    p.save()
+    return f"portfolio_{item['number']}_{item['name']}.pdf", buffer.getvalue()
+
+def build_portfolio_zip(items, workers=None, progress=None):
+    """全員分の PDF を作って 1 つの ZIP (バイト列) にまとめる。progress(完了数, 全体数) を都度呼ぶ"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        if len(items) < POOL_MIN_ITEMS or (os.cpu_count() or 1) < 2:
+            results = map(render_portfolio, items)
+            pool = None
+        else:
+            # Streamlit のサーバープロセスを fork しないよう spawn で起動する
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+            results = pool.map(render_portfolio, items, chunksize=max(1, len(items) // 16))
+        try:
+            for i, (name, data) in enumerate(results, 1):
+                zf.writestr(name, data)
+                if progress: progress(i, len(items))
+        finally:
+            if pool: pool.shutdown()
+    return buffer.getvalue()
@@ -0,0 +1,103 @@
+import os
+import time
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+# コンディションとフィジカルテストの過去分を Parquet で保存するシーズンアーカイブ。
+# <ARCHIVE_ROOT>/<テーブル>/season=2025/month=4/player_name=<選手>/part-0.parquet の形で分割し、
+# 読み込み時は必要な列だけ・該当するシーズン / 月 / 選手のファイルだけを開く（Streamlit には依存しない）
+ARCHIVE_ROOT = os.environ.get("TEAM_OPS_ARCHIVE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+SEASON_START_MONTH = 4  # シーズンは 4 月始まり
+
+ARCHIVE_SCHEMAS = {
+    "conditions": pa.schema([
+        ("id", pa.int64()), ("date", pa.date32()), ("weight", pa.float64()), ("fatigue", pa.int64()),
+        ("sleep", pa.int64()), ("injury", pa.string()), ("injury_detail", pa.string()),
+    ]),
+    "physical_tests": pa.schema([
+        ("id", pa.int64()), ("date", pa.date32()), ("test_name", pa.string()), ("value", pa.float64()),
+    ]),
+}
+PARTITIONING = ds.partitioning(pa.schema([("season", pa.int16()), ("month", pa.int8()), ("player_name", pa.string())]), flavor="hive")
+VERSION_FILE = "_VERSION"  # ds.dataset は "_" で始まるファイルを読み飛ばす
+
+def archive_columns(table_name):
+    return ",".join(["player_name"] + ARCHIVE_SCHEMAS[table_name].names)
+
+def season_of(day):
+    return day.year if day.month >= SEASON_START_MONTH else day.year - 1
+
+def season_start(season):
+    return date(season, SEASON_START_MONTH, 1)
+
+def _path(table_name, root):
+    return os.path.join(root or ARCHIVE_ROOT, table_name)
+
+def archive_version(table_name, root=None):
+    # 書き込みのたびに更新する。読み込み結果のキャッシュキーに使う
+    try:
+        with open(os.path.join(_path(table_name, root), VERSION_FILE)) as f: return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+def _dataset(table_name, root=None):
+    path = _path(table_name, root)
+    if not os.path.isdir(path): return None
+    return ds.dataset(path, format="parquet", partitioning=PARTITIONING, schema=pa.unify_schemas([ARCHIVE_SCHEMAS[table_name], PARTITIONING.schema]))
+
+def _to_arrow(table_name, df):
+    schema = ARCHIVE_SCHEMAS[table_name]
+    dates = pd.to_datetime(df["date"])
+    cols = {c: df[c] if c in df.columns else None for c in schema.names}
+    cols["date"] = dates.dt.date
+    out = pa.Table.from_pandas(pd.DataFrame(cols), schema=schema, preserve_index=False)
+    season = (dates.dt.year - (dates.dt.month < SEASON_START_MONTH)).to_numpy()
+    return (out.append_column("season", pa.array(season, pa.int16()))
+               .append_column("month", pa.array(dates.dt.month.to_numpy(), pa.int8()))
+               .append_column("player_name", pa.array(df["player_name"].astype(str), pa.string())))
+
+def write_archive(table_name, df, root=None):
+    """ライブの行をアーカイブに書き込み、書き込んだ行数を返す。
+    月単位のファイルを丸ごと置き換えるので、対象の月に既にある行とは id で突き合わせて（ライブ側を優先して）まとめ直す"""
+    if df.empty: return 0
+    new = _to_arrow(table_name, df)
+    months = pa.Table.from_pydict({"season": new["season"], "month": new["month"]}).group_by(["season", "month"]).aggregate([])
+    dataset = _dataset(table_name, root)
+    if dataset is not None:
+        in_months = None
+        for s, m in zip(months["season"].to_pylist(), months["month"].to_pylist()):
+            cond = (pc.field("season") == s) & (pc.field("month") == m)
+            in_months = cond if in_months is None else in_months | cond
+        old = dataset.to_table(filter=in_months & ~pc.field("id").isin(new["id"])).select(new.column_names)
+        new = pa.concat_tables([old, new.cast(old.schema)])
+    ds.write_dataset(new, _path(table_name, root), format="parquet", partitioning=PARTITIONING,
+                     basename_template="part-{i}.parquet", existing_data_behavior="delete_matching")
+    with open(os.path.join(_path(table_name, root), VERSION_FILE), "w") as f: f.write(str(time.time_ns()))
+    return len(df)
+
+def read_archive(table_name, columns=None, players=None, start=None, end=None, root=None):
+    """アーカイブから [start, end) の行を読む。columns で列を、players / 期間でシーズン・月・選手のファイルを絞り込む"""
+    dataset = _dataset(table_name, root)
+    names = ["player_name"] + ARCHIVE_SCHEMAS[table_name].names
+    if dataset is None: return pd.DataFrame(columns=columns or names)
+    cond = pc.scalar(True)
+    if players is not None: cond &= pc.field("player_name").isin(list(players))
+    # 日付の条件だけでは行グループの統計しか使えないので、シーズンの条件も付けてディレクトリ単位で読み飛ばす
+    if start is not None: cond &= (pc.field("season") >= season_of(start)) & (pc.field("date") >= pa.scalar(start, pa.date32()))
+    if end is not None: cond &= (pc.field("season") <= season_of(end)) & (pc.field("date") < pa.scalar(end, pa.date32()))
+    df = dataset.to_table(columns=list(columns or names), filter=cond).to_pandas()
+    return df.sort_values("date", kind="stable", ignore_index=True) if "date" in df.columns else df
+
+def archive_summary(table_name, root=None):
+    # シーズン・月ごとの行数と選手数
+    dataset = _dataset(table_name, root)
+    if dataset is None: return pd.DataFrame(columns=["season", "month", "rows", "players"])
+    t = dataset.to_table(columns=["season", "month", "player_name"])
+    out = t.group_by(["season", "month"]).aggregate([("player_name", "count"), ("player_name", "count_distinct")]).to_pandas()
+    out.columns = ["season", "month", "rows", "players"]
+    out["order"] = (out["month"] - SEASON_START_MONTH) % 12
+    return out.sort_values(["season", "order"]).drop(columns="order").reset_index(drop=True)
@@ -0,0 +1,87 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# チーム全体のコンディション・フィジカルテストの集計（要注意アラート、ストリーク、身体能力スコア）。
+# Streamlit にもデータの取得にも依存しない純粋な計算なので、players.py からもテストからもそのまま import する
+PHYS_TESTS = ["30mスプリント (秒)", "プロアジリティ (秒)", "垂直跳び (cm)", "Yo-Yoテスト (m)"]
+
+# 要注意アラート。全選手分を一度のソートと groupby + shift で判定する（前回比に加えて、直近の連続傾向も見る）
+ALERT_THRESHOLDS = {"fatigue_jump": 3, "sleep_drop": 3, "weight_drop": 1.5, "trend_entries": 3, "low_sleep": 2}
+
+def detect_condition_alerts(df_cond, thresholds=None):
+    t = dict(ALERT_THRESHOLDS, **(thresholds or {}))
+    if df_cond.empty or "player_name" not in df_cond.columns: return pd.DataFrame(columns=["player_name", "date", "理由"])
+    d = df_cond.sort_values(["player_name", "date"] + (["id"] if "id" in df_cond.columns else []), kind="stable", ignore_index=True)
+    prev = d.groupby("player_name", sort=False)[["fatigue", "sleep", "weight"]].shift(1)
+    new_player = d["player_name"].ne(d["player_name"].shift())
+    rising = d["fatigue"] - prev["fatigue"] > 0
+    low_sleep = d["sleep"] <= t["low_sleep"]
+    # 選手の切り替わりか条件が途切れた所でリセットする連続回数
+    rising_run = rising.astype(int).groupby(((~rising) | new_player).cumsum()).cumsum()
+    low_run = low_sleep.astype(int).groupby(((~low_sleep) | new_player).cumsum()).cumsum()
+    n = int(t["trend_entries"])
+    flags = pd.DataFrame({
+        "疲労急増": d["fatigue"] - prev["fatigue"] >= t["fatigue_jump"],
+        "睡眠悪化": prev["sleep"] - d["sleep"] >= t["sleep_drop"],
+        "体重急減": prev["weight"] - d["weight"] >= t["weight_drop"],
+        f"疲労{n}回連続上昇": rising_run >= n,
+        f"睡眠不足{n}回連続": low_run >= n,
+    })
+    latest = ~d["player_name"].duplicated(keep="last")
+    flags, d = flags[latest], d[latest]
+    hit = flags.any(axis=1)
+    reasons = flags[hit].dot(flags.columns + ", ").str[:-2]
+    return pd.DataFrame({"player_name": d.loc[hit, "player_name"], "date": d.loc[hit, "date"], "理由": reasons}).reset_index(drop=True)
+
+# 連続入力（ストリーク）は火〜金のみ数える（月・土・日は飛ばす）。営業日番号に変換し、連番の長さで全選手分を一度に計算する
+STREAK_WEEKMASK = "0111100"
+STREAK_EPOCH = np.datetime64("1970-01-01")
+
+def calculate_streaks(df_cond, today=None):
+    cols = ["player_name", "current_streak", "longest_streak"]
+    if df_cond.empty or "player_name" not in df_cond.columns: return pd.DataFrame(columns=cols)
+    today = np.datetime64(today or date.today(), "D")
+    days = pd.to_datetime(df_cond["date"]).values.astype("datetime64[D]")
+    valid = np.is_busday(days, weekmask=STREAK_WEEKMASK) & (days <= today)
+    d = pd.DataFrame({"player_name": df_cond["player_name"].values[valid],
+                      "n": np.busday_count(STREAK_EPOCH, days[valid], weekmask=STREAK_WEEKMASK)})
+    d = d.drop_duplicates().sort_values(["player_name", "n"], ignore_index=True)
+    run_id = (d["player_name"].ne(d["player_name"].shift()) | d["n"].diff().ne(1)).cumsum()
+    runs = d.groupby(run_id).agg(player_name=("player_name", "first"), end=("n", "last"), length=("n", "size"))
+    # 今日が対象日なら今日、まだ未入力なら直前の対象日で終わる連番が現在のストリーク
+    t = np.busday_count(STREAK_EPOCH, today, weekmask=STREAK_WEEKMASK)
+    ends = [t, t - 1] if np.is_busday(today, weekmask=STREAK_WEEKMASK) else [t - 1]
+    result = pd.DataFrame({
+        "current_streak": runs[runs["end"].isin(ends)].groupby("player_name")["length"].max(),
+        "longest_streak": runs.groupby("player_name")["length"].max(),
+    })
+    result = result.reindex(pd.Index(df_cond["player_name"].unique(), name="player_name")).fillna(0).astype(int)
+    return result.reset_index()[cols]
+
+def calculate_streak(player_name, df_cond):
+    streaks = calculate_streaks(df_cond)
+    row = streaks[streaks["player_name"] == player_name]
+    return int(row["current_streak"].iloc[0]) if not row.empty else 0
+
+def calculate_physical_score_matrix(df_phys):
+    # 全選手 × 全テストのスコアを一度に計算する（各選手・各テストの最新値を、テストごとの min / max で 20〜100 に正規化。秒は小さいほど高得点）
+    cols = ["player_name", "テスト", "スコア", "実数値", "単位"]
+    if df_phys.empty or "test_name" not in df_phys.columns: return pd.DataFrame(columns=cols)
+    latest = df_phys[df_phys["test_name"].isin(PHYS_TESTS)].sort_values("date", kind="stable").drop_duplicates(subset=["player_name", "test_name"], keep="last")
+    if latest.empty: return pd.DataFrame(columns=cols)
+    vals = latest["value"].astype(float)
+    by_test = vals.groupby(latest["test_name"])
+    max_val, min_val = by_test.transform("max"), by_test.transform("min")
+    span = (max_val - min_val).where(max_val != min_val)
+    score = (100 * (max_val - vals) / span).where(latest["test_name"].str.contains("秒"), 100 * (vals - min_val) / span)
+    score = np.trunc(score.fillna(70)).clip(20, 100).astype(int)
+    matrix = pd.DataFrame({
+        "player_name": latest["player_name"],
+        "テスト": latest["test_name"].str.replace(r" \((秒|cm|m)\)", "", regex=True),
+        "スコア": score, "実数値": vals,
+        "単位": latest["test_name"].str.split().str[-1].where(latest["test_name"].str.contains(" "), ""),
+        "order": latest["test_name"].map({t: i for i, t in enumerate(PHYS_TESTS)}),
+    })
+    return matrix.sort_values(["player_name", "order"]).drop(columns="order").reset_index(drop=True)
@@ -0,0 +1,235 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# テーブルの取得と全セッション共有のキャッシュ（Streamlit には依存しない。players.py は st.cache_resource で 1 つだけ作る）。
+# client は supabase の Client か local_backend.LocalClient。TTL内はキャッシュを返し、TTL切れ後は id / updated_at の高水位線より新しい行だけを取得する
+TABLE_CACHE_TTL = 30
+# 差分同期は新しい id（と updated_at）しか拾わないので、このプロセス以外での更新・削除はこの間隔の全件取得で反映する
+TABLE_CACHE_RESYNC_SECONDS = 300
+# 読まれなくなったクエリ（日付で区切った期間など）は一定時間で捨て、件数も上限を超えたら古い順に捨てる
+TABLE_CACHE_IDLE_SECONDS = 900
+TABLE_CACHE_MAX_ENTRIES = 64
+# 変更フィードのイベントはテーブルごとに溜め、次の fetch でまとめて当てる。溜まりすぎた場合（読まれないまま一括取り込みが続いた等）は破棄して取り直す
+TABLE_CACHE_MAX_PENDING = 5000
+
+def _rows_to_df(rows):
+    df = pd.DataFrame(rows)
+    if not df.empty and "date" in df.columns:
+        df["date"] = pd.to_datetime(df["date"]).dt.date
+    return df
+
+# ページ単位の並列取得。PostgREST の max-rows (既定 1000) で黙って切り捨てられないよう range() で全件を辿る
+FETCH_PAGE_SIZE = 1000
+FETCH_WORKERS = 4
+
+def _fetch_page(client, table_name, columns, filters, start, size, count=None):
+    query = client.table(table_name).select(columns, count=count)
+    for op, col, val in filters:
+        query = getattr(query, op)(col, val)
+    return query.order("id").range(start, start + size - 1).execute()
+
+def fetch_rows(client, table_name, columns="*", filters=(), stats=None):
+    started = time.time()
+    first = _fetch_page(client, table_name, columns, filters, 0, FETCH_PAGE_SIZE, count="exact")
+    total = first.count if first.count is not None else len(first.data)
+    # サーバー側の max-rows が小さい場合は実際に返ってきた件数をページサイズとする
+    size = len(first.data) if 0 < len(first.data) < min(total, FETCH_PAGE_SIZE) else FETCH_PAGE_SIZE
+    frames = [_rows_to_df(first.data)]
+    last_len = len(first.data)
+    if last_len == size:
+        starts = list(range(size, total, size))
+        if starts:
+            with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+                # map は開始位置順に返すので、届いたページから順に DataFrame 化して id 順を保つ
+                for res in pool.map(lambda s: _fetch_page(client, table_name, columns, filters, s, size), starts):
+                    frames.append(_rows_to_df(res.data))
+                    last_len = len(res.data)
+        # count 取得後に追加された行があれば末尾まで順に読む
+        while last_len == size:
+            res = _fetch_page(client, table_name, columns, filters, size * len(frames), size)
+            frames.append(_rows_to_df(res.data))
+            last_len = len(res.data)
+    frames = [f for f in frames if not f.empty]
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else (frames[0] if frames else pd.DataFrame())
+    if stats is not None:
+        stats["rows"] = stats.get("rows", 0) + len(df)
+        stats["bytes"] = stats.get("bytes", 0) + int(df.memory_usage(deep=True).sum())
+        stats["pages"] = stats.get("pages", 0) + len(frames)
+        stats["seconds"] = stats.get("seconds", 0.0) + time.time() - started
+    return df
+
+class TableCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ttl = TABLE_CACHE_TTL
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.resets = {}
+        self.stats = {}
+        self.pending = {}
+
+    def fetch(self, client, table_name, columns="*", filters=()):
+        key = (table_name, columns, tuple(filters))
+        now = time.time()
+        with self.lock:
+            self._apply_pending(table_name)
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry["used_at"] = now
+                self.entries.move_to_end(key)
+        if entry is not None and now - entry["synced_at"] < self.ttl:
+            return entry["df"]
+
+        synced_at = now
+        loaded_at = entry["loaded_at"] if entry is not None else now
+        stats = {}
+        rewritten = False
+        if entry is None or entry["df"].empty or "id" not in entry["df"].columns:
+            df = fetch_rows(client, table_name, columns, filters, stats)
+            changed = True
+        elif now - entry["loaded_at"] >= TABLE_CACHE_RESYNC_SECONDS:
+            df = fetch_rows(client, table_name, columns, filters, stats)
+            loaded_at = now
+            changed = rewritten = not df.equals(entry["df"])
+        else:
+            df = entry["df"]
+            parts = [fetch_rows(client, table_name, columns, tuple(filters) + (("gt", "id", int(df["id"].max())),), stats)]
+            if "updated_at" in df.columns and df["updated_at"].notna().any():
+                parts.append(fetch_rows(client, table_name, columns, tuple(filters) + (("gt", "updated_at", df["updated_at"].max()),), stats))
+            parts = [d for d in parts if not d.empty]
+            changed = bool(parts)
+            # 既存の id が更新された場合は、差分を積み上げている集計側に作り直しを知らせる
+            rewritten = any((d["id"] <= df["id"].max()).any() for d in parts)
+            if changed:
+                df = pd.concat([df] + parts, ignore_index=True).drop_duplicates("id", keep="last").sort_values("id", ignore_index=True)
+
+        with self.lock:
+            # 取得中に invalidate された場合は古い結果で上書きしない
+            if self.entries.get(key) is entry:
+                self.entries[key] = {"df": df, "synced_at": synced_at, "loaded_at": loaded_at, "used_at": now}
+                self.entries.move_to_end(key)
+                if changed: self.versions[table_name] = self.versions.get(table_name, 0) + 1
+                if rewritten: self.resets[table_name] = self.resets.get(table_name, 0) + 1
+            self._evict(now)
+            total = self.stats.setdefault(table_name, {"requests": 0, "rows": 0, "bytes": 0, "pages": 0, "seconds": 0.0})
+            total["requests"] += 1
+            for k, v in stats.items(): total[k] += v
+        return df
+
+    def _evict(self, now):
+        # lock を持った状態で呼ぶ
+        for key in [k for k, e in self.entries.items() if now - e["used_at"] > TABLE_CACHE_IDLE_SECONDS]:
+            del self.entries[key]
+        while len(self.entries) > TABLE_CACHE_MAX_ENTRIES:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, table_name, full=False):
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == table_name]:
+                if full: del self.entries[key]
+                else: self.entries[key] = dict(self.entries[key], synced_at=0)
+            self.versions[table_name] = self.versions.get(table_name, 0) + 1
+            if full: self.resets[table_name] = self.resets.get(table_name, 0) + 1
+
+    def patch(self, table_name, rows):
+        # upsert の返り値（更新後の行）をキャッシュ済みの行へ直接当てる。新しい id の行は TTL を切って差分同期に任せる
+        new = _rows_to_df(rows)
+        if new.empty or "id" not in new.columns:
+            return self.invalidate(table_name, full=True)
+        with self.lock:
+            rewritten = False
+            for key, entry in [(k, e) for k, e in self.entries.items() if k[0] == table_name]:
+                df = entry["df"]
+                if not df.empty and "id" in df.columns and df["id"].isin(new["id"]).any():
+                    hit = new[new["id"].isin(df["id"])].reindex(columns=df.columns)
+                    df = pd.concat([df[~df["id"].isin(hit["id"])], hit], ignore_index=True).sort_values("id", ignore_index=True)
+                    rewritten = True
+                self.entries[key] = dict(entry, df=df, synced_at=0)
+            self.versions[table_name] = self.versions.get(table_name, 0) + 1
+            if rewritten: self.resets[table_name] = self.resets.get(table_name, 0) + 1
+
+    def apply_change(self, table_name, event, record, old_record=None):
+        # 変更フィードの 1 行分。ここでは積むだけにして（一括取り込みでは 1 行ごとに届くため）、_apply_pending でまとめて当てる
+        with self.lock:
+            # 埋め込み select の項目は生の行に埋め込み先の列が無く、埋め込み先テーブルの変更でも古くなるので破棄して取り直す
+            embedded = [k for k in self.entries if _embeds(k[1], table_name) or (k[0] == table_name and "(" in k[1])]
+            for key in embedded:
+                del self.entries[key]
+                self.versions[key[0]] = self.versions.get(key[0], 0) + 1
+                self.resets[key[0]] = self.resets.get(key[0], 0) + 1
+            if any(k[0] == table_name for k in self.entries):
+                pending = self.pending.setdefault(table_name, [])
+                pending.append((event, record, old_record))
+                if len(pending) > TABLE_CACHE_MAX_PENDING:
+                    del self.pending[table_name]
+                    for key in [k for k in self.entries if k[0] == table_name]: del self.entries[key]
+                    self.resets[table_name] = self.resets.get(table_name, 0) + 1
+            self.versions[table_name] = self.versions.get(table_name, 0) + 1
+
+    def _apply_pending(self, table_name):
+        # lock を持った状態で呼ぶ。溜まったイベントを id ごとに最後の状態へまとめ、各項目に 1 回の削除 + 追加で当てる（再取得しない）。
+        # フィルタを評価できない項目は TTL を切って差分同期に任せる
+        events = self.pending.pop(table_name, None)
+        if not events: return
+        last, unknown = {}, False
+        for event, record, old_record in events:
+            row_id = (record or old_record or {}).get("id")
+            if row_id is None: unknown = True
+            else: last[row_id] = record if record and event != "DELETE" else None
+        ids = list(last)
+        records = [r for r in last.values() if r is not None]
+        new = _rows_to_df(records)
+        rewritten = False
+        for key, entry in [(k, e) for k, e in self.entries.items() if k[0] == table_name]:
+            df = entry["df"]
+            matches = [_row_matches(r, key[2]) for r in records]
+            if unknown or df.empty or "id" not in df.columns or None in matches:
+                self.entries[key] = dict(entry, synced_at=0)
+                continue
+            hit = df["id"].isin(ids)
+            rewritten = rewritten or bool(hit.any())
+            add = new[matches].reindex(columns=df.columns) if records else new
+            if hit.any() or not add.empty:
+                kept = df[~hit]
+                df = pd.concat([kept, add], ignore_index=True) if not add.empty else kept.reset_index(drop=True)
+                if not add.empty and not kept.empty and add["id"].min() < kept["id"].max(): df = df.sort_values("id", ignore_index=True)
+            self.entries[key] = dict(entry, df=df)
+        if rewritten: self.resets[table_name] = self.resets.get(table_name, 0) + 1
+
+    def version(self, table_name):
+        with self.lock:
+            return self.versions.get(table_name, 0)
+
+    def reset_count(self, table_name):
+        # 既存行の更新・削除の回数。追記分だけを積み上げる集計はこれが変わったら作り直す
+        with self.lock:
+            return self.resets.get(table_name, 0)
+
+    def stats_df(self):
+        with self.lock:
+            return pd.DataFrame([dict(table=t, **v) for t, v in self.stats.items()])
+
+_FILTER_OPS = {"eq": lambda a, b: a == b, "neq": lambda a, b: a != b, "gt": lambda a, b: a > b, "gte": lambda a, b: a >= b, "lt": lambda a, b: a < b, "lte": lambda a, b: a <= b}
+
+def _embeds(columns, table_name):
+    # select の列指定が table_name を埋め込んでいるか（"*,injury_reports!inner(...)" など）
+    return f"{table_name}(" in columns or f"{table_name}!" in columns
+
+def _row_matches(record, filters):
+    # クエリ計画のフィルタを 1 行に当てはめる。評価できない場合 (埋め込み先の列・型の不一致など) は None
+    for op, col, val in filters:
+        if col not in record: return None
+        v = record[col]
+        try:
+            if op == "in_": ok = v in val
+            elif op == "is_": ok = v is None if val in (None, "null") else v == val
+            elif op in _FILTER_OPS: ok = v is not None and _FILTER_OPS[op](v, val)
+            else: return None
+        except TypeError:
+            return None
+        if not ok: return False
+    return True
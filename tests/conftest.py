@@ -0,0 +1,5 @@
+import pathlib
+import sys
+
+# アプリのモジュール（squad_metrics.py など）はリポジトリ直下にあるので、どこから pytest を実行しても import できるようにする
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from squad_metrics import detect_condition_alerts
+
+# 前回比の 3 条件だけを比べるため、連続傾向の条件は成立しないようにする
+DAY_OVER_DAY = {"trend_entries": 10 ** 9, "low_sleep": -1}
+
+def make_conditions(n_rows, n_players, seed=0):
+    rng = np.random.default_rng(seed)
+    days = n_rows // n_players
+    df = pd.DataFrame({
+        "player_name": np.repeat([f"選手{i}" for i in range(n_players)], days),
+        "date": np.tile(pd.date_range("2024-01-01", periods=days).date, n_players),
+        "fatigue": rng.integers(1, 6, days * n_players),
+        "sleep": rng.integers(1, 6, days * n_players),
+        "weight": (60 + rng.normal(0, 1.5, days * n_players)).round(1),
+    })
+    return df.sample(frac=1, random_state=seed, ignore_index=True)
+
+def loop_alerts(df_cond):
+    # 以前の選手ごとのループ
+    out = {}
+    for p in df_cond["player_name"].unique():
+        d = df_cond[df_cond["player_name"] == p].sort_values("date")
+        if len(d) >= 2:
+            c, pr = d.iloc[-1], d.iloc[-2]
+            r = [k for k, v in {"疲労急増": c["fatigue"]-pr["fatigue"]>=3, "睡眠悪化": pr["sleep"]-c["sleep"]>=3, "体重急減": pr["weight"]-c["weight"]>=1.5}.items() if v]
+            if r: out[p] = ", ".join(r)
+    return out
+
+def test_matches_per_player_loop():
+    df = make_conditions(20_000, 400, seed=1)
+    alerts = detect_condition_alerts(df, DAY_OVER_DAY)
+    assert dict(zip(alerts["player_name"], alerts["理由"])) == loop_alerts(df)
+
+def test_trend_rules():
+    df = pd.DataFrame({
+        "player_name": ["a"] * 4 + ["b"] * 3,
+        "date": list(pd.date_range("2026-10-01", periods=4).date) + list(pd.date_range("2026-10-01", periods=3).date),
+        "fatigue": [1, 2, 3, 4, 3, 3, 3], "sleep": [4, 4, 4, 4, 2, 1, 2], "weight": [60.0] * 7,
+    })
+    reasons = dict(zip(*detect_condition_alerts(df).loc[:, ["player_name", "理由"]].T.values))
+    assert reasons == {"a": "疲労3回連続上昇", "b": "睡眠不足3回連続"}
+
+def test_empty():
+    assert detect_condition_alerts(pd.DataFrame()).empty
+
+def test_100k_rows_benchmark():
+    df = make_conditions(100_000, 100)
+    detect_condition_alerts(df)  # 初回の import などを除く
+    started = time.perf_counter()
+    detect_condition_alerts(df)
+    assert time.perf_counter() - started < 1.0
@@ -0,0 +1,60 @@
+import time
+
+import pandas as pd
+
+from local_backend import LocalClient
+from table_cache import TableCache, fetch_rows
+
+COND_COLUMNS = "id,player_name,date,weight,fatigue,sleep"
+REHAB_JOIN = "id,injury_id,target_week_start,is_approved,injury_reports!inner(player_name,injury_name,is_active)"
+
+def make_client(tmp_path):
+    client = LocalClient(str(tmp_path / "t.db"), str(tmp_path / "storage"))
+    cache = TableCache()
+    # ChangeFeed.on_change と同じ受け渡し
+    client.subscribe(lambda p: cache.apply_change(p["data"]["table"], p["data"]["type"], p["data"].get("record"), p["data"].get("old_record")))
+    return client, cache
+
+def cond_row(i):
+    return {"player_name": f"選手{i % 7}", "date": str(pd.Timestamp("2024-01-01") + pd.Timedelta(days=i)), "weight": 60.0, "fatigue": 3, "sleep": 3}
+
+def test_batched_events_match_a_fresh_fetch(tmp_path):
+    client, cache = make_client(tmp_path)
+    client.table("conditions").insert([cond_row(i) for i in range(300)]).execute()
+    queries = [(COND_COLUMNS, ()), (COND_COLUMNS, (("eq", "player_name", "選手3"),))]
+    for cols, flt in queries: cache.fetch(client, "conditions", cols, flt)
+
+    # 一括取り込み相当の 1 行ずつのイベント（insert 500 件 + update + delete）
+    started = time.perf_counter()
+    for i in range(300, 800): client.table("conditions").insert(cond_row(i)).execute()
+    client.table("conditions").update({"fatigue": 5}).eq("player_name", "選手3").lt("id", 50).execute()
+    client.table("conditions").delete().lt("id", 20).execute()
+    assert len(cache.pending["conditions"]) >= 500
+    version = cache.version("conditions")
+    assert version >= 500
+
+    for cols, flt in queries:
+        got = cache.fetch(client, "conditions", cols, flt)
+        expected = fetch_rows(client, "conditions", cols, flt)
+        pd.testing.assert_frame_equal(got.reset_index(drop=True), expected[got.columns], check_dtype=False)
+    assert "conditions" not in cache.pending
+    assert cache.reset_count("conditions") == 1
+    assert time.perf_counter() - started < 5
+
+def test_embedded_entries_are_refetched(tmp_path):
+    client, cache = make_client(tmp_path)
+    inj = client.table("injury_reports").insert({"player_name": "選手1", "injury_name": "捻挫", "is_active": True}).execute().data[0]
+    client.table("rehab_plans").insert({"injury_id": inj["id"], "target_week_start": "2024-05-06", "is_approved": False}).execute()
+    flt = (("eq", "injury_reports.is_active", True),)
+    assert len(cache.fetch(client, "rehab_plans", REHAB_JOIN, flt)) == 1
+
+    # 埋め込み先の列を持たない生の行は当てずに取り直す
+    client.table("rehab_plans").insert({"injury_id": inj["id"], "target_week_start": "2024-05-13", "is_approved": False}).execute()
+    df = cache.fetch(client, "rehab_plans", REHAB_JOIN, flt)
+    assert len(df) == 2 and df["injury_reports"].map(lambda r: isinstance(r, dict)).all()
+
+    # 故障情報を閉じると、結合済みの計画も取り直される
+    version = cache.version("rehab_plans")
+    client.table("injury_reports").update({"is_active": False}).eq("id", inj["id"]).execute()
+    assert cache.version("rehab_plans") > version
+    assert cache.fetch(client, "rehab_plans", REHAB_JOIN, flt).empty
@@ -0,0 +1,88 @@
+import time
+from decimal import Decimal, ROUND_FLOOR
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from withholding_tax import calculate_withholding_tax as scalar_tax
+from withholding_tax import calculate_withholding_tax_array as array_tax
+from withholding_tax import read_tax_table
+
+# 形式確認用の小さな表（実際の税額ではない）。最後の 2 行は「lower の場合の税額 + 超える金額の rate %」の行
+TABLE_CSV = """lower,upper,dep_0,dep_1,dep_2,rate,extra_dependent
+88000,89000,130,0,0,,0
+89000,90000,180,0,0,,0
+90000,100000,500,100,0,,50
+100000,200000,3000,1500,300,,200
+200000,300000,8000,6000,4000,10.21,500
+300000,,20000,17000,14000,20.42,1000
+"""
+
+def table_reference(income, deps):
+    # 1 人ずつ Decimal で計算した表引き
+    rows = pd.read_csv(pd.io.common.StringIO(TABLE_CSV))
+    if income < rows["lower"].iloc[0]: return 0
+    row = rows[rows["lower"] <= income].iloc[-1]
+    k = min(deps, 2)
+    tax = Decimal(int(row[f"dep_{k}"]))
+    if not pd.isna(row["rate"]):
+        tax += ((Decimal(income) - Decimal(int(row["lower"]))) * Decimal(str(row["rate"])) / 100).to_integral_value(ROUND_FLOOR)
+    tax -= max(deps - 2, 0) * Decimal(int(row["extra_dependent"]))
+    return max(int(tax), 0)
+
+@pytest.fixture
+def table(tmp_path):
+    path = tmp_path / "withholding_tax_table.csv"
+    path.write_text(TABLE_CSV)
+    return read_tax_table(str(path))
+
+def test_array_matches_scalar():
+    rng = np.random.default_rng(0)
+    income = np.concatenate([rng.integers(0, 1_500_000, 20_000),
+                             [0, 87_999, 88_000, 149_999, 150_000, 299_999, 300_000, 113_000, 138_000, 175_000]])
+    deps = np.concatenate([rng.integers(0, 8, 20_000), [0, 0, 0, 0, 0, 0, 0, 1, 2, 1]])
+    expected = [scalar_tax(int(i), int(d)) for i, d in zip(income, deps)]
+    np.testing.assert_array_equal(array_tax(income, deps), expected)
+    # calculate_salary と同じく Series / float の扶養人数でも同じ結果になる
+    np.testing.assert_array_equal(array_tax(pd.Series(income), pd.Series(deps, dtype=float)), expected)
+
+def test_table_lookup_and_formula_rows(table):
+    income = [0, 87_999, 88_000, 88_999, 89_000, 95_000, 150_000, 200_000, 250_003, 299_999, 300_000, 1_234_567]
+    for deps in range(6):
+        got = array_tax(income, [deps] * len(income), table)
+        assert list(got) == [table_reference(i, deps) for i in income], deps
+
+def test_table_format_errors(tmp_path):
+    assert read_tax_table(str(tmp_path / "missing.csv")) is None
+    gap = tmp_path / "gap.csv"
+    gap.write_text("lower,upper,dep_0\n88000,89000,130\n90000,100000,500\n")
+    with pytest.raises(ValueError):
+        read_tax_table(str(gap))
+
+def test_table_upper_bound_and_dependents(tmp_path):
+    path = tmp_path / "closed.csv"
+    path.write_text("lower,upper,dep_0,dep_1\n88000,89000,130,0\n89000,90000,180,0\n")
+    closed = read_tax_table(str(path))
+    assert list(array_tax([89_500], [1], closed)) == [0]
+    with pytest.raises(ValueError):
+        array_tax([90_000], [0], closed)  # 表の上限を超える
+    with pytest.raises(ValueError):
+        array_tax([89_500], [2], closed)  # 列より多い扶養人数で extra_dependent が無い
+    # 非課税の額なら扶養人数が列より多くても 0
+    assert list(array_tax([50_000], [5], closed)) == [0]
+
+@pytest.mark.parametrize("deps", [[-1], [1.5], [np.nan]])
+def test_invalid_dependents(deps, table):
+    with pytest.raises(ValueError):
+        array_tax([200_000], deps)
+    with pytest.raises(ValueError):
+        array_tax([200_000], deps, table)
+
+def test_100k_rows_benchmark():
+    rng = np.random.default_rng(1)
+    income = rng.integers(0, 1_500_000, 100_000)
+    deps = rng.integers(0, 8, 100_000)
+    start = time.perf_counter()
+    array_tax(income, deps)
+    assert time.perf_counter() - start < 0.5
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# 源泉徴収税額の計算（Streamlit に依存しない。payroll.py が import する）。
+# 月額表の CSV が無い場合は簡易版の税額区分で計算する
+
+def calculate_withholding_tax(taxable_income, dependents):
+    """源泉徴収税額表（簡易版）"""
+    if taxable_income < 88000: return 0
+    adjusted_income = taxable_income - (dependents * 25000)
+    if adjusted_income < 88000: return 0
+    
+    tax = 0
+    if adjusted_income < 150000:
+        tax = adjusted_income * 0.02
+    elif adjusted_income < 300000:
+        tax = (adjusted_income * 0.05) - 2000 
+    else:
+        tax = (adjusted_income * 0.10) - 10000 
+    return max(0, int(tax))
+
+# 税額計算のベクトル版。上の calculate_withholding_tax と同じ区分を配列にし、全員分を searchsorted で一度に引く
+TAX_DEPENDENT_DEDUCTION = 25000
+TAX_BRACKET_LOWER = np.array([88000, 150000, 300000])
+TAX_BRACKET_RATE = np.array([0.02, 0.05, 0.10])
+TAX_BRACKET_OFFSET = np.array([0, 2000, 10000])
+
+# 国税庁の月額表（甲欄）を使う場合は、国税庁の「源泉徴収税額表」から転記した CSV を読む（同梱はしていない）。列は
+#   lower（以上）, upper（未満。最後の行は空欄で上限なし）, dep_0 ... dep_7（扶養親族等の数ごとの税額）
+#   rate（任意）: 表の上の方の「lower の場合の税額に、lower を超える金額の rate % を加算した金額」の行に入れる（1 円未満切捨て）
+#   extra_dependent（任意）: dep_ 列の最大人数を超える扶養親族 1 人ごとに差し引く額
+def read_tax_table(path):
+    """月額表を配列の dict で返す。ファイルが無ければ None"""
+    if not os.path.exists(path): return None
+    table = pd.read_csv(path).sort_values('lower', ignore_index=True)
+    dep_cols = sorted((c for c in table.columns if c.startswith('dep_')), key=lambda c: int(c[4:]))
+    lower = table['lower'].to_numpy(float)
+    upper = table['upper'].fillna(np.inf).to_numpy(float)
+    if not dep_cols or [int(c[4:]) for c in dep_cols] != list(range(len(dep_cols))) \
+            or (upper <= lower).any() or (upper[:-1] != lower[1:]).any() or table[dep_cols].isna().any().any():
+        raise ValueError(f"源泉徴収税額表の形式が正しくありません: {path}")
+    rate = table['rate'].fillna(0).to_numpy(float) if 'rate' in table.columns else np.zeros(len(table))
+    extra = table['extra_dependent'].to_numpy(float) if 'extra_dependent' in table.columns else np.full(len(table), np.nan)
+    return {"lower": lower, "upper": upper, "amounts": table[dep_cols].to_numpy(float), "rate": rate, "extra": extra}
+
+def _table_tax(income, deps, table):
+    lower, upper, amounts = table["lower"], table["upper"], table["amounts"]
+    row = np.searchsorted(lower, income, side='right') - 1
+    r = row.clip(0)
+    taxed = row >= 0  # 表の最初の行より少ない額は非課税
+    if (taxed & (income >= upper[r])).any():
+        raise ValueError("源泉徴収税額表の上限を超える課税対象額があります（表の最後の行の upper を空欄にしてください）")
+    max_dep = amounts.shape[1] - 1
+    over = np.maximum(deps - max_dep, 0)
+    if (taxed & (over > 0) & np.isnan(table["extra"][r])).any():
+        raise ValueError(f"扶養人数が {max_dep} 人を超える行があります（税額表に extra_dependent の列が必要です）")
+    # rate は % 表記。浮動小数の誤差で 1 円ずれないよう丸めてから切り捨てる
+    added = np.floor(np.round((income - lower[r]) * table["rate"][r] / 100, 6))
+    tax = amounts[r, np.minimum(deps, max_dep).astype(int)] + added - over * np.nan_to_num(table["extra"][r])
+    return np.where(taxed, np.maximum(tax, 0), 0).astype(int)
+
+def calculate_withholding_tax_array(taxable_income, dependents, table=None):
+    """全員分の源泉徴収税額を配列で返す。table が無い場合は calculate_withholding_tax と同じ結果になる"""
+    income = np.asarray(taxable_income, dtype=float)
+    deps = np.asarray(dependents, dtype=float)
+    if ((deps < 0) | (deps != np.floor(deps))).any():
+        raise ValueError("扶養人数に負の値または整数でない値があります")
+    if table is not None: return _table_tax(income, deps, table)
+    adjusted = income - deps * TAX_DEPENDENT_DEDUCTION
+    bracket = np.searchsorted(TAX_BRACKET_LOWER, adjusted, side='right') - 1
+    i = bracket.clip(0)
+    tax = np.trunc(adjusted * TAX_BRACKET_RATE[i] - TAX_BRACKET_OFFSET[i])
+    return np.where((income < TAX_BRACKET_LOWER[0]) | (bracket < 0), 0, np.maximum(0, tax)).astype(int)